@@ -14,6 +14,8 @@ tjn, 12 XI 2015, uses quickfunctions and imageutilssubset modules
 tjn, 16 XI 2015, modified single_pixel() and added all_pixels()
 tjn, 11 XI 2016, modified single_pixel() examples
 tjn, CS, MU, 12 XI 2020, updated for Jupyter Notebook
+tjn, 16 X 2026, all_pixels() writes frames on a background thread
+tjn, 16 X 2026, clip displayed spectrum at a percentile rather than 0.1% of max
 
 Tested with Python 3.7.3 on Jupyter Notebook 6.0.3.
 
@@ -33,14 +35,15 @@ In this worksheet we look at 2D sinusoids and their FTs.
 """
 
 import os
-from numpy import (mgrid, pi, sin, real, imag, zeros, rot90, amax, ceil,
+from numpy import (mgrid, pi, sin, real, imag, zeros, rot90, ceil,
                    random, angle)
 from scipy.fftpack import fft2, ifft2, fftshift, ifftshift
 from numpy import absolute as abs
 import matplotlib
 
 from quickfunctions import quick_close, quick_show
-from imageutilssubset import imread_sc, imsave_sc, create_animated_gif
+from imageutilssubset import imread_sc, create_animated_gif, ImageWriter
+from skimage_exposure import intensity_range
 
 # matplotlib.rcParams.update({'font.size': 13})
 # matplotlib.rcParams.update({'savefig.dpi': 300})
@@ -273,7 +276,7 @@ quick_show(abs(Fa),
            cmap='grey',
            title='Fourier amplitude (from which we take individual pixels )',
            normalise=False,
-           vmax=0.001 * amax(abs(Fa)))
+           vmax=intensity_range(abs(Fa), ('pct', 0, 99))[1])
 
 
 def single_pixel(Fa, r, c, showfigs=True):
@@ -418,25 +421,29 @@ def all_pixels(fpath, num_frames=4, view='ampl', showfigs=False):
     # animation.
     temp_fnames, anim_fname = get_temp_fnames(num_pixels, view)
     # Generate the Fourier domain masks corresponding to the new pixels added
-    # for each frame of the animation.
-    for fname, p, q in zip(temp_fnames, [0] + num_pixels, num_pixels):
-        # Choose a number of pixel coordinates to Fourier transform (from the
-        # end of the randonly-generated list), and return as an image of
-        # space-domain complex-valued sinusoids.
-        # Add the complex-valued sinusoids to the accumulator
-        acc += single_pixel(Fa, row[p:q], col[p:q], showfigs=False)
-        # Write the frame to disk
-        if view in ('phase', 'phas', 'angle'):
-            acc_view = angle(acc)
-        elif view is 'real':
-            acc_view = real(acc)
-        elif view is 'imag':
-            acc_view = imag(acc)
-        else:
-            acc_view = abs(acc)
-        imsave_sc(fname, acc_view)
-        if showfigs:
-            raise NotImplementedError('Showing figures not implemented yet.')
+    # for each frame of the animation. Frames are written to disk by a
+    # background thread, while the next frame is being computed.
+    with ImageWriter() as writer:
+        for fname, p, q in zip(temp_fnames, [0] + num_pixels, num_pixels):
+            # Choose a number of pixel coordinates to Fourier transform (from
+            # the end of the randonly-generated list), and return as an image
+            # of space-domain complex-valued sinusoids.
+            # Add the complex-valued sinusoids to the accumulator
+            acc += single_pixel(Fa, row[p:q], col[p:q], showfigs=False)
+            # Write the frame to disk (each view is a new array, so it does
+            # not need to be copied before being queued).
+            if view in ('phase', 'phas', 'angle'):
+                acc_view = angle(acc)
+            elif view is 'real':
+                acc_view = real(acc)
+            elif view is 'imag':
+                acc_view = imag(acc)
+            else:
+                acc_view = abs(acc)
+            writer.save(fname, acc_view, copy=False)
+            if showfigs:
+                raise NotImplementedError('Showing figures not implemented ' +
+                                          'yet.')
 
     # Create an animated GIF from these decoded frames
     create_animated_gif(temp_fnames, delay=200, out_fname=anim_fname)
@@ -22,20 +22,170 @@ tjn, 26 XI 2015, roll_2d function
 tjn, 13 II 2017, ensure pad() receives only integers as `pad_width`
 tjn, 26 VI 2017, window_2d can crop one dim while padding the other
 tjn, 22 X 2020, using a custom version of `rescale_intensity`
+tjn, 16 X 2026, validation modes ('strict', 'fast', 'off') for argument checks
+tjn, 16 X 2026, window_2d pads with a single allocation, out and copy arguments
+tjn, 16 X 2026, shift() for N-D arrays and stacks, out argument, sub-pixel mode
+tjn, 16 X 2026, roll_2d with a single copy, RolledView class
+tjn, 16 X 2026, LRU cache of read-only masks, annulus and sector functions
+tjn, 16 X 2026, cached imread_sc, concurrent imread_many
+tjn, 16 X 2026, ImageWriter class for writing images on background threads
+tjn, 16 X 2026, AnimationWriter (GIF/APNG) replaces ImageMagick's convert
+tjn, 16 X 2026, tiles() and map_tiles() for processing images in tiles
+tjn, 16 X 2026, imsave_sc maps uint16 images through a cached lookup table
+tjn, 16 X 2026, band function
+tjn, 16 X 2026, ArrayCache class made public
 
 Tested with Anaconda using Python 3.6.
 """
 
+import os
 import warnings
-import subprocess
-
-from scipy import (pad, isscalar, ndarray, array, zeros, ogrid, rint, uint8,
-                   ceil, roll)
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from numbers import Number
+from queue import Queue
+from threading import Lock, Thread
+from time import perf_counter
+from struct import pack
+
+from scipy import (isscalar, ndarray, array, zeros, ogrid, rint, uint8, ceil,
+                   empty, where, exp, pi, iscomplexobj, asarray, arange, ix_,
+                   arctan2, degrees, ascontiguousarray, stack, uint16, sin,
+                   cos, radians, issubdtype, number, bool_)
+from numpy import dtype as numpy_dtype
+from scipy.fftpack import fftn, ifftn, fftfreq
 
 from skimage import util, io
+from PIL import Image, GifImagePlugin
 
 # from skimage.exposure import rescale_intensity
-from skimage_exposure import rescale_intensity
+from skimage_exposure import rescale_intensity, intensity_range, apply_lut
+
+"""
+
+Module-level variables
+
+"""
+# The recognised argument validation modes. 'strict' examines every element
+# of an array argument individually in Python, 'fast' uses only the dtype and
+# NumPy reductions (no per-element Python loops), and 'off' skips all checks
+# on array arguments.
+VALIDATION_MODES = ('strict', 'fast', 'off')
+# The validation mode used when a function is called with validate=None. It
+# can be overwritten by a caller, or changed using set_validation_mode().
+VALIDATION_MODE = 'fast'
+# The maximum total size (in bytes) of the masks cached by disc(), annulus(),
+# sector(), and band(). Use set_mask_cache_size() to change it after import.
+MASK_CACHE_BYTES = 64 * 2 ** 20
+# The maximum total size (in bytes) of the decoded images cached by
+# imread_sc() and imread_many(). Use set_imread_cache_size() to change it
+# after import.
+IMREAD_CACHE_BYTES = 256 * 2 ** 20
+
+
+def set_validation_mode(mode):
+    """Set the module-wide argument validation mode.
+
+    'mode' is one of 'strict', 'fast', or 'off'. The previous mode is returned
+    so that the caller can restore it afterwards.
+    """
+    global VALIDATION_MODE
+    previous_mode = VALIDATION_MODE
+    VALIDATION_MODE = _validation_mode(mode)
+    return previous_mode
+
+
+def _validation_mode(mode=None):
+    """Return the validation mode to use, given a (possibly None) per-call
+    argument. None means use the module-wide mode VALIDATION_MODE.
+    """
+    if mode is None:
+        mode = VALIDATION_MODE
+    if mode not in VALIDATION_MODES:
+        raise ValueError("Validation mode should be one of " +
+                         str(VALIDATION_MODES) + ", not '" + str(mode) + "'.")
+    return mode
+
+
+class ArrayCache:
+    """A least-recently-used cache of read-only arrays, bounded by the total
+    number of bytes of the arrays it holds.
+
+    get(key, make_array) returns the cached array for 'key', or calls
+    make_array() to create it, makes it read-only, and caches it (unless it
+    alone is larger than 'max_bytes'). The least recently used arrays are
+    evicted to keep the total size within 'max_bytes'. It is safe to use from
+    several threads.
+
+    For example, the masks made by disc() and the images read by imread_sc()
+    are cached by ArrayCache objects, and TemplateMatcher caches template
+    spectra in one.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._arrays = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, make_array):
+        """Return the array for 'key', calling make_array() to create it if
+        it is not already in the cache.
+        """
+        with self._lock:
+            a = self._arrays.get(key)
+            if a is not None:
+                self._arrays.move_to_end(key)
+                self.hits += 1
+                return a
+            self.misses += 1
+        # Create the array outside the lock, so that other threads are not
+        # blocked while it is being computed.
+        a = make_array()
+        a.flags.writeable = False
+        with self._lock:
+            if key not in self._arrays and a.nbytes <= self.max_bytes:
+                self._arrays[key] = a
+                self._bytes += a.nbytes
+                self._evict(self.max_bytes)
+        return a
+
+    def _evict(self, max_bytes):
+        # Remove the least recently used arrays until within budget
+        while self._bytes > max_bytes:
+            _, a = self._arrays.popitem(last=False)
+            self._bytes -= a.nbytes
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        """Set the maximum total size in bytes, evicting arrays if needed."""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict(max_bytes)
+
+    def clear(self):
+        """Remove every array from the cache (the statistics are kept)."""
+        with self._lock:
+            self._arrays.clear()
+            self._bytes = 0
+
+    def info(self):
+        """Return a dict of the numbers of hits, misses, and evictions, the
+        number of entries, and the current and maximum size in bytes.
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._arrays),
+                    'bytes': self._bytes,
+                    'max_bytes': self.max_bytes}
 
 
 def _is_numeric_scalar(a, min_val=None):
@@ -65,7 +215,8 @@ def _ensure_numeric_array(a,
                           num_dims=None,
                           min_val=None,
                           lbound=None,
-                          order=None):
+                          order=None,
+                          mode=None):
     """Ensure that argument is a nonempty ndarray of numeric scalars.
 
     Lists and tuples are allowed as argument 'a'. The user is responsible for
@@ -81,7 +232,8 @@ def _ensure_numeric_array(a,
                          num_dims=num_dims,
                          min_val=min_val,
                          lbound=lbound,
-                         order=order)
+                         order=order,
+                         mode=mode)
     return a
 
 
@@ -90,7 +242,8 @@ def _check_numeric_array(a,
                          num_dims=None,
                          min_val=None,
                          lbound=None,
-                         order=None):
+                         order=None,
+                         mode=None):
     """Check that argument is a nonempty ndarray of numeric scalars.
 
     Arguments:
@@ -105,8 +258,21 @@ def _check_numeric_array(a,
         than.
     'order' an ordering on the data where '>' means strictly increasing.
         Arrays are ordered according to their ndarray.flat iterator.
+    'mode' is the validation mode: 'strict' checks each element of 'a' in
+        turn, 'fast' relies on the dtype of 'a' and on NumPy reductions, and
+        'off' performs no checks at all. None means use VALIDATION_MODE.
 
     If the argument is not of the correct type, an error is raised.
+
+    NaN is a numeric value, in every mode:
+
+    >>> _check_numeric_array(array([[1, float('nan')], [2, 3]]), mode='strict')
+    >>> _check_numeric_array(array([1, float('nan')], dtype=object),
+    ...                      mode='strict')
+    >>> _check_numeric_array(array(['1', '2']), mode='strict')
+    Traceback (most recent call last):
+        ...
+    ValueError: Argument should be an ndarray of numeric scalars.
     """
 
     def _strictly_increasing(L):
@@ -114,9 +280,19 @@ def _check_numeric_array(a,
         # questions/4983258/python-how-to-check-list-monotonicity
         return all(x < y for x, y in zip(L, L[1:]))
 
+    def _strictly_increasing_fast(a):
+        # Compare each element with its successor using a single vectorised
+        # comparison over the flattened array.
+        a = a.ravel()
+        return (a[1:] > a[:-1]).all()
+
     """
     Functionality begins here
     """
+    mode = _validation_mode(mode)
+    if mode == 'off':
+        return
+    strict = (mode == 'strict')
     # Check argument type and check that it is nonempty
     if (not isinstance(a, ndarray)) or (a.size == 0):
         raise TypeError('Argument should be a nonempty ndarray.')
@@ -128,16 +304,28 @@ def _check_numeric_array(a,
     if (num_dims is not None) and len(a.shape) != num_dims:
         raise ValueError('Argument should be a ndarray with exactly ' +
                          str(num_dims) + ' dimensions.')
-    # Check type of values in array
-    first_val = next(a.flat)
-    if not _is_numeric_scalar(first_val):
+    # Check type of values in array. A numeric (or bool) dtype is sufficient.
+    # The elements of an object array are checked individually: every element
+    # in strict mode, otherwise only the first element. NaN is a numeric
+    # value.
+    if issubdtype(a.dtype, number) or issubdtype(a.dtype, bool_):
+        numeric = True
+    elif a.dtype == object:
+        values = a.flat if strict else (a.flat[0],)
+        numeric = all(isinstance(val, Number) for val in values)
+    else:
+        numeric = False
+    if not numeric:
         raise ValueError('Argument should be an ndarray of numeric scalars.')
+    # The smallest value in 'a' (only calculated if needed, and at most once)
+    a_min = None
     # Check if each element of 'a' is >= the minimum value, if appropriate
     # (at this stage we know each element of 'a' is a numeric scalar).
     if min_val is not None:
         if not _is_numeric_scalar(min_val):
             raise ValueError('Argument should be a numeric scalar.')
-        elif min(a.flat) < min_val:
+        a_min = min(a.flat) if strict else a.min()
+        if a_min < min_val:
             raise ValueError('Argument should have values >= ' +
                              str(min_val) + '.')
     # Check if each element of 'a' is > the lower bound, if appropriate
@@ -145,21 +333,27 @@ def _check_numeric_array(a,
     if lbound is not None:
         if not _is_numeric_scalar(lbound):
             raise ValueError('Argument should be a numeric scalar.')
-        elif min(a.flat) <= lbound:
+        if a_min is None:
+            a_min = min(a.flat) if strict else a.min()
+        if a_min <= lbound:
             raise ValueError('Argument should have values > ' + str(lbound) +
                              '.')
     # Check if each element of 'a' is ordered, if appropriate
     # (at this stage we know each element of 'a' is a numeric scalar).
     if order is not None:
         if order == '>':
-            if not _strictly_increasing(a.flat):
+            if strict:
+                increasing = _strictly_increasing(a.flat)
+            else:
+                increasing = _strictly_increasing_fast(a)
+            if not increasing:
                 raise ValueError('Argument should be a list of strictly ' +
                                  'increasing numbers.')
         else:
             raise ValueError("Unrecognised argument '" + str(order) + "'.")
 
 
-def _ensure_pair_numeric_array(a, min_val=None, lbound=None):
+def _ensure_pair_numeric_array(a, min_val=None, lbound=None, mode=None):
     """Ensure that argument is a pair of numeric scalars in a ndarray.
 
     If a scalar is passed, use it for each element of the pair. Lists/tuples
@@ -170,17 +364,45 @@ def _ensure_pair_numeric_array(a, min_val=None, lbound=None):
     return _ensure_numeric_array(a,
                                  shape=(2,),
                                  min_val=min_val,
-                                 lbound=lbound)
+                                 lbound=lbound,
+                                 mode=mode)
 
 
-def _check_2d_numeric_array(a, min_val=None, order=None):
+def _check_2d_numeric_array(a, min_val=None, order=None, mode=None):
     """Check that argument is a nonempty 2D ndarray of numeric scalars.
     If the argument is not of the correct type, an error is raised.
     """
-    _check_numeric_array(a, num_dims=2, min_val=min_val, order=order)
+    _check_numeric_array(a, num_dims=2, min_val=min_val, order=order,
+                         mode=mode)
+
+
+# The cache of decoded images used by imread_sc() and imread_many()
+_imread_cache = ArrayCache(IMREAD_CACHE_BYTES)
+
+
+def set_imread_cache_size(max_bytes):
+    """Set the maximum total memory (in bytes) used by cached images.
+
+    Least recently used images are evicted immediately if the cache is
+    larger than the new size. A size of 0 disables caching.
+    """
+    _imread_cache.resize(_ensure_int(max_bytes, min_val=0))
+
+
+def imread_cache_info():
+    """Return a dict of statistics about the image cache used by imread_sc()
+    and imread_many(): the numbers of hits, misses, and evictions, the number
+    of entries, and the current and maximum size in bytes.
+    """
+    return _imread_cache.info()
+
+
+def clear_imread_cache():
+    """Remove all images from the image cache (the statistics are kept)."""
+    _imread_cache.clear()
 
 
-def imread_sc(fname, as_gray=True):
+def imread_sc(fname, as_gray=True, cache=True, copy=True):
     """Read an image file from disk and rescale to the range [0, 1].
 
     This function reads an image file, converts its uint8 values to floats,
@@ -198,12 +420,72 @@ def imread_sc(fname, as_gray=True):
     from disk is ndarray([[100, 120], [110, 115]], dtype=uint8) then the value
     returned from this function will be ndarray([[0., 1.], [0.5, 0.75]]).
 
+    If cache is True, decoded images are kept in memory (see
+    imread_cache_info()) and a file is only decoded again if its modification
+    time or size changes. If copy is False, the cached array itself is
+    returned, which is read-only; otherwise the caller receives its own copy.
+    Anything other than the path of a local file (such as a URL or a file
+    object) is decoded every time, and never cached.
+
     If an exception is thrown, just pass it directly to the caller.
     """
-    return rescale_intensity(util.img_as_float(io.imread(fname)))
-
-
-def imsave_sc(fname, im):
+    def _decode():
+        # The decoded image is a new array, so it can be rescaled in place
+        return rescale_intensity(util.img_as_float(io.imread(fname)),
+                                 inplace=True)
+
+    if not (cache and isinstance(fname, (str, bytes, os.PathLike))):
+        return _decode()
+    # Identify the file by its path, modification time, and size so that a
+    # modified file is decoded again.
+    try:
+        stat = os.stat(fname)
+    except (OSError, ValueError):
+        # Not a local file (e.g. a URL), so leave it to io.imread()
+        return _decode()
+    key = (os.path.abspath(fname), stat.st_mtime_ns, stat.st_size)
+    im = _imread_cache.get(key, _decode)
+    return im.copy() if copy else im
+
+
+def imread_many(fnames, as_gray=True, max_workers=None, prefetch=None,
+                cache=True, copy=True):
+    """Read a sequence of image files using a pool of threads.
+
+    Returns a generator that yields the images, in the same order as
+    'fnames', as they would be returned by imread_sc() (with the same
+    'as_gray', 'cache', and 'copy' arguments). Use list(imread_many(...)) to
+    read them all at once.
+
+    The files are decoded concurrently by up to 'max_workers' threads (None
+    means the ThreadPoolExecutor default). At most 'prefetch' images (default:
+    twice 'max_workers', or twice the number of CPUs) are decoded ahead of
+    the image being consumed, which bounds the memory used when reading many
+    files.
+    """
+    fnames = iter(fnames)
+    if prefetch is None:
+        prefetch = 2 * (max_workers or os.cpu_count() or 1)
+    prefetch = _ensure_int(prefetch, min_val=1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+
+        def _submit_next():
+            # Start decoding the next file, if there is one
+            for fname in fnames:
+                pending.append(executor.submit(imread_sc, fname, as_gray,
+                                               cache, copy))
+                return
+
+        for _ in range(prefetch):
+            _submit_next()
+        while pending:
+            im = pending.popleft().result()
+            _submit_next()
+            yield im
+
+
+def imsave_sc(fname, im, validate=None):
     """Save a real-valued image as an 8-bit depth image.
 
     This function rescales the image if necessary, converts it to uint8
@@ -214,10 +496,13 @@ def imsave_sc(fname, im):
 
     It works for both greyscale and colour images.
 
+    The validate argument selects the validation mode for this call (one of
+    'strict', 'fast', or 'off'), or None to use VALIDATION_MODE.
+
     If an exception is thrown, just pass it directly to the caller.
     """
-    if (im > 1).any() or (im < 0).any():
-        im = rescale_intensity(im, out_range=(0, 1))
+    # Raise an error if 'im' is not a nonempty ndarray of numeric scalars
+    _check_numeric_array(im, mode=validate)
     # Convert to integers in the range [0, 255] before saving. Ignore warnings
     # related to low contrast images (we have legitimate reasons to write out
     # completely black frames as images). These warnings are only ignored
@@ -227,10 +512,153 @@ def imsave_sc(fname, im):
         warnings.filterwarnings(action='ignore',
                                 message='.*is a low contrast image.*',
                                 category=UserWarning)
-        io.imsave(fname, rint(im * 255).astype(uint8))
+        io.imsave(fname, _as_uint8(im))
+
 
+def _as_uint8(im):
+    """Convert a real-valued image to uint8 values, as imsave_sc() does.
 
-def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None):
+    Images are stretched and rescaled to the [0, 1] range if they have any
+    values outside this range, then mapped to the range [0, 255].
+    """
+    if im.dtype == uint16:
+        # Map 16-bit images (from a camera, say) through a cached lookup
+        # table rather than converting every pixel to floating point
+        imin, imax = intensity_range(im)
+        if imax <= 1:
+            return apply_lut(im, _uint16_table(0, 1))
+        if imin != imax:
+            return apply_lut(im, _uint16_table(int(imin), int(imax)))
+    if (im > 1).any() or (im < 0).any():
+        im = rescale_intensity(im, out_range=(0, 1))
+    return rint(im * 255).astype(uint8)
+
+
+@lru_cache(maxsize=16)
+def _uint16_table(imin, imax):
+    """Return the (read-only) lookup table that _as_uint8() uses for uint16
+    images with values in the range [imin, imax].
+    """
+    values = rescale_intensity(arange(65536, dtype=float),
+                               in_range=(imin, imax), out_range=(0, 1))
+    table = rint(values * 255).astype(uint8)
+    table.setflags(write=False)
+    return table
+
+
+class ImageWriter:
+    """Save images with imsave_sc() on background threads.
+
+    Images passed to save() are placed on a bounded queue and rescaled,
+    quantised, and encoded by 'workers' threads, so that the caller can
+    continue computing the next image. If the queue holds 'max_queue' images
+    (at least 1; the queue is never unbounded), save() blocks until there is
+    space.
+
+    An exception raised while writing an image is raised again in the
+    caller's thread by the next call to save(), flush(), or close().
+
+    Use as a context manager, which calls close() on exit:
+
+        with ImageWriter() as writer:
+            for n, frame in enumerate(frames):
+                writer.save('frame' + str(n) + '.png', frame)
+    """
+
+    def __init__(self, max_queue=8, workers=1):
+        self._queue = Queue(maxsize=_ensure_int(max_queue, min_val=1))
+        self._lock = Lock()
+        self._error = None
+        self._closed = False
+        # Statistics
+        self.written = 0
+        self.write_seconds = 0.
+        self._threads = [Thread(target=self._work, daemon=True)
+                         for _ in range(_ensure_int(workers, min_val=1))]
+        for thread in self._threads:
+            thread.start()
+
+    def _work(self):
+        """Worker thread: write queued images until a None is dequeued."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                start = perf_counter()
+                imsave_sc(*item)
+                with self._lock:
+                    self.written += 1
+                    self.write_seconds += perf_counter() - start
+            except Exception as e:
+                with self._lock:
+                    # Keep the first error, and note which file caused it
+                    if self._error is None:
+                        self._error = (item[0], e)
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        """Raise (once) any error encountered by a worker thread."""
+        with self._lock:
+            error, self._error = self._error, None
+        if error is not None:
+            fname, e = error
+            raise RuntimeError('Unable to write file "' + str(fname) +
+                               '".') from e
+
+    def save(self, fname, im, validate=None, copy=True):
+        """Queue 'im' to be written to 'fname' with imsave_sc().
+
+        If copy is False, the caller must not modify im until it has been
+        written (e.g. until flush() returns).
+        """
+        if self._closed:
+            raise ValueError('Cannot save to a closed ImageWriter.')
+        self._raise_error()
+        self._queue.put((fname, im.copy() if copy else im, validate))
+
+    @property
+    def depth(self):
+        """The number of images waiting in the queue."""
+        return self._queue.qsize()
+
+    def stats(self):
+        """Return a dict containing the queue depth, the number of images
+        written, the total time spent writing them, and the resulting write
+        throughput (images per second, per worker thread).
+        """
+        with self._lock:
+            written, seconds = self.written, self.write_seconds
+        return {'depth': self.depth,
+                'written': written,
+                'write_seconds': seconds,
+                'images_per_second': (written / seconds if seconds else 0.)}
+
+    def flush(self):
+        """Wait until every queued image has been written."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Write every queued image, then stop the worker threads."""
+        if not self._closed:
+            self._closed = True
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None,
+              validate=None, out=None, copy=False):
     """A function for padding, cropping, pasting 2D NumPy arrays.
 
     Pad image im up to shape 'win' while keeping im centred.
@@ -240,10 +668,16 @@ def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None):
     If an odd number of rows/columns are to be padded/cropped then do less
     at left & above and do more at right & below.
 
+    A pure crop (and a window with the same shape as im) returns a view of im
+    without copying any values, unless 'copy' is True or 'out' is passed.
+    Padding, in either or both dimensions, allocates the result once (or uses
+    'out') and copies the values of im into it once.
+
     Arguments
     ---------
-    im : 2D ndarray
-        Image to be manipulated.
+    im : 2D ndarray or RolledView
+        Image to be manipulated. Cropping a RolledView reads only the pixels
+        inside the window.
     win : integer pair; integer scalar
         Desired shape of returned image. If a scalar, then assume it
         represents square side length.
@@ -262,11 +696,33 @@ def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None):
         (0, 1) denotes centre right, and so on.
         If a scalar, assume an identical shift in each dimension.
         If this argument is not None, then the shift argument is ignored.
+    validate : str or None
+        Validation mode for the arguments of this call, one of 'strict',
+        'fast', or 'off'. If None, use the module-level VALIDATION_MODE.
+    out : 2D ndarray or None
+        Preallocated array with shape 'win' to hold the result, which is then
+        returned. Useful for avoiding an allocation per call in tight loops.
+    copy : bool
+        If True, always return a new array (or 'out'), never a view of im.
+
+    A window that pads one dimension and crops the other is the same as the
+    pure pad and pure crop of each dimension, including any shift:
+
+    >>> im = arange(70).reshape(7, 10)
+    >>> mixed = window_2d(im, (9, 6), shift=(1, 1))
+    >>> cropped = window_2d(im, (7, 6), shift=(0, 1))
+    >>> print((mixed == window_2d(cropped, (9, 6), shift=(1, 0))).all())
+    True
+    >>> padded = window_2d(im, (9, 10), shift=(1, 0))
+    >>> print((mixed == window_2d(padded, (9, 6), shift=(0, 1))).all())
+    True
     """
     # Raise an error if 'im' is not a 2D ndarray of numeric scalars. Empty 2D
-    # arrays are allowed.
-    if not (isinstance(im, ndarray) and im.shape == (0, 0)):
-        _check_2d_numeric_array(im)
+    # arrays are allowed. A RolledView is checked through its base image.
+    if isinstance(im, RolledView):
+        _check_2d_numeric_array(im.base, mode=validate)
+    elif not (isinstance(im, ndarray) and im.shape == (0, 0)):
+        _check_2d_numeric_array(im, mode=validate)
 
     # Deal with the rel_shift argument. Differentiate between 0 and None.
     if rel_shift is not None:
@@ -284,13 +740,19 @@ def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None):
 
     # Ensure 'win' and 'shift' each describe a 2D array consisting of exactly
     # two numeric scalars (if a scalar is passed, use it for each dimension).
-    win = _ensure_pair_numeric_array(win)
-    shift = _ensure_pair_numeric_array(shift)
+    win = _ensure_pair_numeric_array(win, mode=validate)
+    shift = _ensure_pair_numeric_array(shift, mode=validate)
     # Convert to type int (because truncated floats are not sufficient for
     # function `pad`)
     win = win.astype(int)
     shift = shift.astype(int)
 
+    # Ensure a preallocated output array (if passed) has the window's shape
+    if (out is not None) and (not isinstance(out, ndarray) or
+                              out.shape != tuple(win)):
+        raise ValueError('Argument out should be a ndarray with shape ' +
+                         str(tuple(win)) + '.')
+
     # There are four cases to consider: no operations required, cropping
     # each dimension, padding each dimension, and a different operation for
     # each dimension.
@@ -301,7 +763,7 @@ def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None):
             raise ValueError('window_2d() does not know how to deal with a ' +
                              'nonzero shift argument when the window and ' +
                              'input have the same shape.')
-        return im
+        result = im
 
     # The case where the window is smaller than the input
     elif (win <= im.shape).all():
@@ -312,58 +774,369 @@ def window_2d(im, win, shift=(0, 0), new_val=0, rel_shift=None):
         #        xend = xstart + win[1]
         start = (im.shape - win) // 2 + shift
         end = start + win
-        return im[start[0]:end[0], start[1]:end[1]]
-
-    # The case where the window is larger than the input
-    elif (win >= im.shape).all():
-        # Calculating the padding required on each side of im
-        #        ybefore = (shape[0] - im.shape[0]) // 2
-        #        yafter = shape[0] - im.shape[0] - ybefore
-        #        xbefore = (shape[1] - im.shape[1]) // 2
-        #        xafter = shape[1] - im.shape[1] - xbefore
-        before = (win - im.shape) // 2 + shift
-        after = win - im.shape - before
-        return pad(im,
-                   #    ((before[0], after[0]), (before[1], after[1])),
-                   list(zip(before, after)),
-                   mode='constant',
-                   constant_values=new_val)
-
-    # The case where the window is larger than the input in one dimension and
-    # smaller than the input in the other dimension.
+        # A pure crop is a view of im; no pixel values are copied
+        result = im[start[0]:end[0], start[1]:end[1]]
+
+    # The case where the window is larger than the input in at least one
+    # dimension. This includes the case where the window is larger than the
+    # input in one dimension and smaller than the input in the other
+    # dimension.
     else:
-        # Do the required processing one dimension at a time
-        im = window_2d(im,
-                       (win[0], im.shape[1]),
-                       shift=shift,
-                       new_val=new_val,
-                       rel_shift=rel_shift)
-        im = window_2d(im,
-                       (im.shape[0], win[1]),
-                       shift=shift,
-                       new_val=new_val,
-                       rel_shift=rel_shift)
-        return im
-
-
-def roll_2d(im, shift):
-    """Perform two successive orthogonal roll() operations.
-
-    Each element of shift is passed directly to SciPy's roll().
+        # Calculating the position of im's top left pixel within the window.
+        # In each padded dimension:
+        #        ybefore = (shape[0] - im.shape[0]) // 2 + shift[0]
+        #        xbefore = (shape[1] - im.shape[1]) // 2 + shift[1]
+        # and in each cropped dimension this is minus the start index of the
+        # crop, -((im.shape - win) // 2 + shift), so that both operations are
+        # consistent with those above.
+        before = where(win >= im.shape,
+                       (win - im.shape) // 2 + shift,
+                       -((im.shape - win) // 2) - shift)
+        return _paste(im, before, win, new_val, out)
+
+    # Only a crop (or nothing at all) was required, so 'result' refers to
+    # (part of) im. Copy it if requested.
+    if isinstance(result, RolledView):
+        # Cropping a RolledView already produced an ndarray; otherwise roll
+        # the whole image now.
+        result = asarray(result)
+    if out is not None:
+        out[...] = result
+        return out
+    elif copy:
+        return result.copy()
+    else:
+        return result
+
+
+def _paste(im, before, win, new_val=0, out=None):
+    """Return a window of shape 'win' containing im, with the top left pixel
+    of im at index 'before' of the window (its indices may be negative), and
+    every other pixel set to new_val.
+
+    The result is allocated once (unless 'out' is passed), only the border
+    is filled with new_val, and the overlapping region of im is copied once.
+    Any dimensions of im beyond the first two are retained.
+    """
+    if out is None:
+        out = empty(tuple(win) + im.shape[2:], dtype=im.dtype)
+    rows, im_rows = _overlap(before[0], im.shape[0], win[0])
+    cols, im_cols = _overlap(before[1], im.shape[1], win[1])
+    out[:rows.start, :] = new_val
+    out[rows.stop:, :] = new_val
+    out[rows, :cols.start] = new_val
+    out[rows, cols.stop:] = new_val
+    out[rows, cols] = im[im_rows, im_cols]
+    return out
+
+
+def _overlap(before, length, win_length):
+    """Return the overlap of a 1D array and a 1D window as a pair of slices.
+
+    The array of length 'length' is positioned with its first element at
+    index 'before' of a window of length 'win_length' ('before' can be
+    negative). The first slice indexes the overlap in the window and the
+    second slice indexes the same overlap in the array. If there is no
+    overlap, both slices are empty.
+    """
+    start = min(max(before, 0), win_length)
+    stop = max(min(before + length, win_length), start)
+    return slice(start, stop), slice(start - before, stop - before)
+
+
+# A tile of an image, as produced by tiles(). 'core' is the pair of slices
+# (rows, columns) of the image that the tile is responsible for, 'tile' is the
+# tile array itself (the core surrounded by a halo), and 'trim' is the pair of
+# slices of 'tile' (or of any result computed from it) that contain the core.
+Tile = namedtuple('Tile', ('index', 'core', 'tile', 'trim'))
+
+
+def tiles(im, tile_shape, halo=0, edge='pad', new_val=0):
+    """Iterate over an image as a grid of overlapping tiles.
+
+    The image is divided into core regions of shape 'tile_shape' (smaller at
+    the bottom and right edges if the image shape is not a multiple of
+    'tile_shape'), and each tile consists of a core region surrounded by a
+    halo 'halo' pixels wide (use a pair for different vertical and
+    horizontal halos). A Tile (see above) is yielded for each core region,
+    in row-major order.
+
+    Tiles are views of im wherever the whole tile lies inside the image.
+    Where the halo extends beyond the image, 'edge' determines the tile:
+    'pad' pads the tile with new_val, as window_2d() does, so that every tile
+    has a complete halo; 'clip' truncates the halo at the image border, so
+    that every tile is a view.
+
+    Only the first two dimensions of im are tiled.
+    """
+    if edge not in ('pad', 'clip'):
+        raise ValueError("Argument edge should be 'pad' or 'clip'.")
+    tile_shape = _ensure_pair_numeric_array(tile_shape, lbound=0).astype(int)
+    halo = _ensure_pair_numeric_array(halo, min_val=0).astype(int)
+    im_rows, im_cols = im.shape[:2]
+    for i, r in enumerate(range(0, im_rows, tile_shape[0])):
+        for j, c in enumerate(range(0, im_cols, tile_shape[1])):
+            core = (slice(r, min(r + tile_shape[0], im_rows)),
+                    slice(c, min(c + tile_shape[1], im_cols)))
+            # The extent of the tile (including its halo) in the image
+            start = array((core[0].start, core[1].start)) - halo
+            stop = array((core[0].stop, core[1].stop)) + halo
+            if edge == 'clip':
+                start = start.clip(0)
+                stop = stop.clip(None, (im_rows, im_cols))
+            if (start >= 0).all() and (stop <= (im_rows, im_cols)).all():
+                # The tile is a crop of im, so use a view
+                tile = im[start[0]:stop[0], start[1]:stop[1]]
+            else:
+                tile = _paste(im, -start, stop - start, new_val)
+            trim = (slice(core[0].start - start[0], core[0].stop - start[0]),
+                    slice(core[1].start - start[1], core[1].stop - start[1]))
+            yield Tile((i, j), core, tile, trim)
+
+
+def map_tiles(func, im, tile_shape, halo=0, edge='pad', new_val=0,
+              max_workers=1, out=None):
+    """Apply 'func' to each tile of im and stitch the results together.
+
+    The image is divided into tiles as by tiles() (see that function for the
+    meaning of 'tile_shape', 'halo', 'edge', and 'new_val'). func(tile) must
+    return an ndarray with the same shape as the tile in its first two
+    dimensions; its halo is trimmed off and its core is copied into the
+    result.
+
+    If max_workers is greater than 1 (or None, for the ThreadPoolExecutor
+    default), tiles are processed concurrently on a pool of threads, which
+    is effective when func spends its time in NumPy/SciPy code that releases
+    the GIL. At most twice 'max_workers' (or twice the number of CPUs) tiles
+    are in progress or waiting to be stitched at any time, so the memory used
+    does not grow with the number of tiles.
+
+    The result has the shape of im in its first two dimensions and the dtype
+    and any further dimensions of func's results, unless 'out' (a
+    preallocated ndarray) is passed. A ValueError is raised if a result does
+    not have the shape of its tile.
+
+    >>> im = arange(30.).reshape(5, 6)
+    >>> print((map_tiles(lambda tile: 2 * tile, im, (2, 4), halo=1) ==
+    ...        2 * im).all())
+    True
+    >>> map_tiles(lambda tile: tile[1:, 1:], im, (2, 4), halo=1)
+    Traceback (most recent call last):
+        ...
+    ValueError: The result for tile (0, 0) should have shape (4, 6) in its \
+first two dimensions, not (3, 5).
+    >>> map_tiles(lambda tile: tile, zeros((0, 6)), (2, 4)).shape
+    (0, 6)
+    """
+    def _apply(t):
+        return t, func(t.tile)
+
+    if max_workers == 1:
+        results = map(_apply, tiles(im, tile_shape, halo, edge, new_val))
+        return _stitch(results, im, out)
+    window = 2 * (max_workers or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = _bounded_map(executor, _apply,
+                               tiles(im, tile_shape, halo, edge, new_val),
+                               window)
+        return _stitch(results, im, out)
+
+
+def _bounded_map(executor, func, items, window):
+    """Yield func(item) for each of 'items', in order, computed on
+    'executor'.
+
+    Unlike executor.map(), which submits every item before yielding the
+    first result, at most 'window' items are submitted ahead of the result
+    being consumed.
+    """
+    items = iter(items)
+    pending = deque(executor.submit(func, item)
+                    for item in islice(items, window))
+    while pending:
+        result = pending.popleft().result()
+        for item in islice(items, 1):
+            pending.append(executor.submit(func, item))
+        yield result
+
+
+def _stitch(results, im, out):
+    """Copy the trimmed core of each (Tile, result) pair into 'out'
+    (allocated from the first result, if None) and return it.
+
+    If there are no tiles (im has no rows or no columns), 'out' or else an
+    empty array with the shape and dtype of im is returned.
+    """
+    for t, result in results:
+        result = asarray(result)
+        if result.shape[:2] != t.tile.shape[:2]:
+            raise ValueError('The result for tile ' + str(t.index) +
+                             ' should have shape ' + str(t.tile.shape[:2]) +
+                             ' in its first two dimensions, not ' +
+                             str(result.shape[:2]) + '.')
+        if out is None:
+            out = empty(im.shape[:2] + result.shape[2:], dtype=result.dtype)
+        out[t.core] = result[t.trim]
+    if out is None:
+        out = empty(im.shape, dtype=im.dtype)
+    return out
+
+
+def roll_2d(im, shift, validate=None, out=None):
+    """Circularly shift the first two dimensions of im, as two successive
+    orthogonal roll() operations would, but with a single copy.
+
+    Each element of shift has the same meaning as the shift argument to
+    SciPy's roll().
     If a scalar, assume an identical shift for each dimension.
+    Argument out is an optional preallocated ndarray with the same shape as
+    im to hold the result (it must not share memory with im).
+    The validate argument selects the validation mode for this call (one of
+    'strict', 'fast', or 'off'), or None to use VALIDATION_MODE.
+
+    See also RolledView, which avoids copying im at all.
     """
     # Ensure 'shift' describes a 2D array consisting of exactly two numeric
     # scalars (if a scalar is passed, use it for each dimension).
-    shift = _ensure_pair_numeric_array(shift)
-    return roll(roll(im, shift[0], axis=0), shift[1], axis=1)
+    shift = _ensure_pair_numeric_array(shift, mode=validate).astype(int)
+    im = asarray(im)
+    if out is None:
+        out = empty(im.shape, dtype=im.dtype)
+    # Copy each of the (at most four) blocks of im to its rolled position
+    for rows, im_rows in _roll_slices(im.shape[0], shift[0]):
+        for cols, im_cols in _roll_slices(im.shape[1], shift[1]):
+            out[rows, cols] = im[im_rows, im_cols]
+    return out
+
+
+def _roll_slices(length, shift):
+    """Return the pairs of slices (destination, source) that circularly
+    shift a 1D array of length 'length' by 'shift' elements.
+    """
+    if length == 0 or shift % length == 0:
+        return ((slice(None), slice(None)),)
+    shift %= length
+    return ((slice(shift, None), slice(None, length - shift)),
+            (slice(None, shift), slice(length - shift, None)))
 
 
-def shift(im, pixels, new_val=0):
-    """Shift a 2D ndarray laterally, padding each new pixel with a constant.
+class RolledView:
+    """A lazily rolled 2D image, equivalent to roll_2d(im, shift) but without
+    copying im.
 
-    Argument im is a 2D ndarray.
-    Argument pixels is a pair (pixels_downwards, pixels_rightwards), where a
-    negative value for either means shift in the opposite direction.
+    Indexing a RolledView (with integers, slices, index arrays, or a boolean
+    mask with the same shape) remaps the indices onto the original image and
+    reads only the requested pixels. For example, the central region of a
+    spectrum rolled by half its size can be cropped with window_2d() without
+    the whole spectrum being rolled first.
+
+    NumPy functions see a RolledView as the equivalent rolled ndarray (which
+    is created by a single copy, using roll_2d()).
+    """
+
+    def __init__(self, im, shift):
+        self.base = asarray(im)
+        if self.base.ndim < 2:
+            raise ValueError('RolledView requires an ndarray with at least ' +
+                             'two dimensions.')
+        shift = _ensure_pair_numeric_array(shift).astype(int)
+        # Store the shift reduced modulo the shape of the image
+        self.shift = tuple(int(s) % max(n, 1)
+                           for s, n in zip(shift, self.base.shape))
+
+    @property
+    def shape(self):
+        return self.base.shape
+
+    @property
+    def ndim(self):
+        return self.base.ndim
+
+    @property
+    def dtype(self):
+        return self.base.dtype
+
+    def __len__(self):
+        return self.base.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        # Only an unshifted view of the base image (with its own dtype) can
+        # be returned without a copy, which NumPy requests with copy=False
+        unchanged = (not any(self.shift) and
+                     (dtype is None or numpy_dtype(dtype) == self.base.dtype))
+        if copy is False:
+            if not unchanged:
+                raise ValueError('A RolledView cannot be converted to an ' +
+                                 'ndarray without a copy.')
+            return self.base
+        a = roll_2d(self.base, self.shift, validate='off')
+        return a if dtype is None else a.astype(dtype, copy=False)
+
+    def _source_index(self, index, axis):
+        """Map an index (int, slice, or index array) along 'axis' of the
+        rolled image to the equivalent index along 'axis' of the base image.
+        """
+        n = self.base.shape[axis]
+        if isinstance(index, slice):
+            index = arange(n)[index]
+        elif isscalar(index):
+            if not -n <= index < n:
+                raise IndexError('Index ' + str(index) + ' is out of bounds ' +
+                                 'for axis ' + str(axis) + ' with size ' +
+                                 str(n) + '.')
+            return (int(index) - self.shift[axis]) % n
+        else:
+            index = asarray(index)
+        return (index - self.shift[axis]) % n
+
+    def __getitem__(self, key):
+        # A boolean mask selects the masked pixels, in row-major order
+        if isinstance(key, ndarray) and key.dtype == bool:
+            if key.shape != self.shape[:2]:
+                raise IndexError('Boolean mask should have shape ' +
+                                 str(self.shape[:2]) + '.')
+            rows, cols = key.nonzero()
+            return self.base[self._source_index(rows, 0),
+                             self._source_index(cols, 1)]
+        if not isinstance(key, tuple):
+            key = (key,)
+        key = key + (slice(None),) * (2 - len(key))
+        rows = self._source_index(key[0], 0)
+        cols = self._source_index(key[1], 1)
+        if isscalar(rows) or isscalar(cols):
+            # Integer indexing removes a dimension, as with an ndarray
+            return self.base[(rows, cols) + key[2:]]
+        return self.base[ix_(rows, cols) + key[2:]]
+
+    def apply_mask(self, mask):
+        """Return a RolledView of this image multiplied by 'mask', where mask
+        is given in the rolled coordinates. Only the mask is rolled (back to
+        the coordinates of the base image); the image itself is not copied
+        more than once by the multiplication.
+        """
+        mask = roll_2d(mask, [-s for s in self.shift], validate='off')
+        if self.base.ndim > 2:
+            mask = mask.reshape(mask.shape + (1,) * (self.base.ndim - 2))
+        return RolledView(self.base * mask, self.shift)
+
+
+def shift(im, pixels, new_val=0, validate=None, out=None, subpixel=False):
+    """Shift an ndarray laterally, padding each new pixel with a constant.
+
+    Argument im is an ndarray with any number of dimensions, for example a 2D
+    image or a stack of 2D images with shape (frames, rows, columns).
+    Argument pixels is a sequence of shifts applied to the last len(pixels)
+    dimensions of im, so for a 2D image or a stack of 2D images it is a pair
+    (pixels_downwards, pixels_rightwards), where a negative value for either
+    means shift in the opposite direction.
+    Argument out is an optional preallocated ndarray with the same shape as
+    im to hold the result. It may be im itself, to shift in place.
+    If argument subpixel is True, then the shift values can be fractional and
+    the shift is performed in the Fourier domain (using the Fourier shift
+    theorem). In this case the shift is circular, as with roll(), and new_val
+    is ignored.
+    The validate argument selects the validation mode for this call (one of
+    'strict', 'fast', or 'off'), or None to use VALIDATION_MODE.
 
     An image with the same shape as im is returned.
 
@@ -371,74 +1144,133 @@ def shift(im, pixels, new_val=0):
     extent of im are lost, rather than circularly shifted to the other end
     of the ndarray as with roll().
     """
+    checking = (_validation_mode(validate) != 'off')
     # Ensure a NumPy array is passed for im
-    if not isinstance(im, ndarray):
+    if checking and not isinstance(im, ndarray):
         raise TypeError('First argument must be of type ndarray.')
-    # Ensure pixels gives a value for each dimension
-    pixels = array(pixels)
-    if pixels.shape != (2,):
+    # Ensure pixels gives a value for at least one, and at most every,
+    # dimension of im.
+    pixels = array(pixels, ndmin=1)
+    if checking and (pixels.ndim != 1 or not (1 <= len(pixels) <= im.ndim)):
         raise TypeError('shift() requires a shift to be specified for ' +
-                        'exactly two dimensions.')
+                        'between one and ' + str(im.ndim) + ' dimensions.')
+    if checking and (out is not None) and (not isinstance(out, ndarray) or
+                                           out.shape != im.shape):
+        raise ValueError('Argument out should be a ndarray with shape ' +
+                         str(im.shape) + '.')
+    # The dimensions of im that are shifted
+    axes = tuple(range(im.ndim - len(pixels), im.ndim))
+
+    if subpixel:
+        result = _fourier_shift(im, pixels, axes)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
     # Ensure pixels contains only ints or truncated floats
-    if (pixels.astype(int) == pixels).all():
-        # Convert to type int
-        pixels = pixels.astype(int)
-    else:
+    if checking and not (pixels.astype(int) == pixels).all():
         raise ValueError('shift() requires shift values to be integers.')
+    # Convert to type int
+    pixels = pixels.astype(int)
+
+    # Calculate, for each dimension, the region of the result that receives
+    # pixels from im, and the region of im that those pixels come from.
+    dst = [slice(None)] * im.ndim
+    src = [slice(None)] * im.ndim
+    for axis, p in zip(axes, pixels):
+        dst[axis], src[axis] = _overlap(p, im.shape[axis], im.shape[axis])
+    # Copy the retained pixels of im once into a single new array (or into
+    # out). This is done before padding so that out can be im itself.
+    if out is None:
+        out = empty(im.shape, dtype=im.dtype)
+    out[tuple(dst)] = im[tuple(src)]
+    # Set the pixels that were shifted in from outside im to new_val
+    for axis in axes:
+        before = [slice(None)] * im.ndim
+        after = [slice(None)] * im.ndim
+        before[axis] = slice(None, dst[axis].start)
+        after[axis] = slice(dst[axis].stop, None)
+        out[tuple(before)] = new_val
+        out[tuple(after)] = new_val
+    return out
+
+
+@lru_cache(maxsize=32)
+def _phase_ramp_frequencies(shape):
+    """Return, for each dimension of 'shape', the Fourier domain frequencies
+    (multiplied by -2*pi*i) in a form that broadcasts along that dimension.
+
+    The results are cached by shape, so repeated sub-pixel shifts of
+    same-shaped arrays only need to evaluate exp() on these 1D arrays.
+    """
+    freqs = []
+    for axis, n in enumerate(shape):
+        f = (-2j * pi) * fftfreq(n)
+        f = f.reshape((n,) + (1,) * (len(shape) - axis - 1))
+        f.flags.writeable = False
+        freqs.append(f)
+    return tuple(freqs)
+
+
+def _fourier_shift(im, pixels, axes):
+    """Circularly shift im by (possibly fractional) 'pixels' along 'axes'
+    using the Fourier shift theorem.
+    """
+    shape = tuple(im.shape[axis] for axis in axes)
+    F = fftn(im, axes=axes)
+    # The phase ramp is separable, so multiply by one 1D ramp per dimension
+    for f, p in zip(_phase_ramp_frequencies(shape), pixels):
+        if p != 0:
+            F *= exp(f * p)
+    result = ifftn(F, axes=axes)
+    # A real-valued image shifted is still real-valued
+    if not iscomplexobj(im):
+        result = result.real
+    return result
+
+
+def shift_r(im, pixels, validate=None):
+    """Wrapper for shift(), to make it as convenient to call as roll().
 
-    # Perform padding followed by cropping in vertical dimension
-    if pixels[0] > 0:
-        im = pad(im,
-                 ((pixels[0], 0), (0, 0)),
-                 'constant',
-                 constant_values=new_val)
-        im = im[:-pixels[0], :]
-    elif pixels[0] < 0:
-        im = pad(im,
-                 ((0, -pixels[0]), (0, 0)),
-                 'constant',
-                 constant_values=new_val)
-        im = im[-pixels[0]:, :]
-    else:
-        # Do nothing
-        pass
-
-    # Perform padding followed by cropping in horizontal dimension
-    if pixels[1] > 0:
-        im = pad(im,
-                 ((0, 0), (pixels[1], 0)),
-                 'constant',
-                 constant_values=new_val)
-        im = im[:, :-pixels[1]]
-    elif pixels[1] < 0:
-        im = pad(im,
-                 ((0, 0), (0, -pixels[1])),
-                 'constant',
-                 constant_values=new_val)
-        im = im[:, -pixels[1]:]
-    else:
-        # Do nothing
-        pass
+    The last dimension of im (horizontal, for a 2D image) is shifted.
+    """
+    return shift(im, (pixels,), validate=validate)
 
-    return im
 
+# The cache shared by disc(), annulus(), and sector()
+_mask_cache = ArrayCache(MASK_CACHE_BYTES)
 
-def shift_r(im, pixels):
-    """Wrapper for shift(), to make it as convenient to call as roll().
+
+def set_mask_cache_size(max_bytes):
+    """Set the maximum total memory (in bytes) used by cached masks.
+
+    Least recently used masks are evicted immediately if the cache is
+    larger than the new size. A size of 0 disables caching.
     """
-    return shift(im, (0, pixels))
+    _mask_cache.resize(_ensure_int(max_bytes, min_val=0))
 
 
-def disc(diameter, shape=None, centre=None, dtype=bool):
-    """Return a mask with shape 'shape' and containing a disc with diameter
-    'diameter' centred at array indices 'centre', and containing values of
-    type 'dtype'.
+def mask_cache_info():
+    """Return a dict of statistics about the mask cache used by disc(),
+    annulus(), sector(), and band(): the numbers of hits, misses, and
+    evictions, the number of entries, and the current and maximum size in
+    bytes.
+    """
+    return _mask_cache.info()
 
-    By convention, and so that each disc will have a well defined central
-    pixel, each disc has odd diameter. When 'shape' has even dimensions, and
-    'centre' == None, the disc's central pixel will be the bottom right pixel
-    of the central four pixels. I.e. when 'shape' is (2, 2) then the central
-    pixel is at index [1,1].
+
+def clear_mask_cache():
+    """Remove all masks from the mask cache (the statistics are kept)."""
+    _mask_cache.clear()
+
+
+def _mask_geometry(diameter, shape, centre, validate):
+    """Validate and normalise the arguments common to disc(), annulus(), and
+    sector().
+
+    Returns the diameter, radius, shape, and centre as ints and tuples of
+    ints, suitable for use in a cache key.
     """
     # Ensure that 'diameter' is valid
     diameter = _ensure_int(diameter)  # , min_val=0) #, min_val=1)
@@ -456,7 +1288,7 @@ def disc(diameter, shape=None, centre=None, dtype=bool):
     else:
         # Ensure shape is a pair of nonzero numeric scalars. Allow a scalar
         # to be passed for 'shape' to indicate a square.
-        shape = _ensure_pair_numeric_array(shape)  # , min_val=diameter)
+        shape = _ensure_pair_numeric_array(shape, mode=validate)
 
     # Ensure that 'centre' is valid
     if centre is None:
@@ -465,22 +1297,415 @@ def disc(diameter, shape=None, centre=None, dtype=bool):
     else:
         # Ensure pair of central indices is a pair of numeric scalars (do not
         # allow a single scalar value).
-        y, x = _ensure_numeric_array(centre, shape=(2,))
+        y, x = _ensure_numeric_array(centre, shape=(2,), mode=validate)
 
-    if diameter == 0:
-        # Take care of the special case of a non-existent disc. Note, this
-        # subltly different from testing for radius == 0, which would have
-        # inadvertantly caught diameter == 1 and diameter == 2.
-        return zeros(shape, dtype=bool)
-    else:
-        # Create two orthogonal 1D arrays describing vertical and horizontal
-        # coordinates respectively.
-        v, h = ogrid[-y:(shape[0] - y), -x:(shape[1] - x)]
+    shape = (int(shape[0]), int(shape[1]))
+    return diameter, radius, shape, (int(y), int(x))
 
-        # Broadcast the orthogonal 1D arrays to define a 2D array. All
-        # coordinates whose hypothenuse is <= the radius will be inside the
-        # disc.
-        return ((v ** 2 + h ** 2) <= radius ** 2).astype(dtype)
+
+def _squared_distances(shape, centre):
+    """Return the squared distance of each pixel from 'centre' as a 2D array,
+    along with the two orthogonal (broadcastable) coordinate arrays.
+    """
+    y, x = centre
+    # Create two orthogonal 1D arrays describing vertical and horizontal
+    # coordinates respectively.
+    v, h = ogrid[-y:(shape[0] - y), -x:(shape[1] - x)]
+    # Broadcast the orthogonal 1D arrays to define a 2D array
+    return v ** 2 + h ** 2, v, h
+
+
+def disc(diameter, shape=None, centre=None, dtype=bool, validate=None):
+    """Return a mask with shape 'shape' and containing a disc with diameter
+    'diameter' centred at array indices 'centre', and containing values of
+    type 'dtype'.
+
+    By convention, and so that each disc will have a well defined central
+    pixel, each disc has odd diameter. When 'shape' has even dimensions, and
+    'centre' == None, the disc's central pixel will be the bottom right pixel
+    of the central four pixels. I.e. when 'shape' is (2, 2) then the central
+    pixel is at index [1,1].
+
+    Masks are cached (see mask_cache_info()), so the returned array is
+    read-only. Use disc(...).copy() to obtain an array that can be modified.
+
+    The validate argument selects the validation mode for this call (one of
+    'strict', 'fast', or 'off'), or None to use VALIDATION_MODE.
+    """
+    diameter, radius, shape, centre = _mask_geometry(diameter, shape, centre,
+                                                     validate)
+
+    def _make_disc():
+        if diameter == 0:
+            # Take care of the special case of a non-existent disc. Note,
+            # this subltly different from testing for radius == 0, which
+            # would have inadvertantly caught diameter == 1 and diameter == 2.
+            return zeros(shape, dtype=bool)
+        # All coordinates whose hypothenuse is <= the radius will be inside
+        # the disc.
+        r2, _, _ = _squared_distances(shape, centre)
+        return (r2 <= radius ** 2).astype(dtype)
+
+    key = ('disc', diameter, shape, centre, numpy_dtype(dtype))
+    return _mask_cache.get(key, _make_disc)
+
+
+def annulus(diameter, inner_diameter, shape=None, centre=None, dtype=bool,
+            validate=None):
+    """Return a mask containing the disc of diameter 'diameter' with the disc
+    of diameter 'inner_diameter' (with the same centre) removed.
+
+    The arguments and conventions are the same as for disc(), and, as with
+    disc(), the returned array is cached and read-only.
+    """
+    diameter, radius, shape, centre = _mask_geometry(diameter, shape, centre,
+                                                     validate)
+    inner_diameter = max(_ensure_int(inner_diameter), 0)
+    # Inner pixels are excluded only if there is an inner disc
+    inner_radius = (inner_diameter - 1) // 2 if inner_diameter > 0 else -1
+
+    def _make_annulus():
+        r2, _, _ = _squared_distances(shape, centre)
+        inside = (r2 <= radius ** 2) if diameter > 0 else zeros(shape, bool)
+        if inner_radius >= 0:
+            inside &= (r2 > inner_radius ** 2)
+        return inside.astype(dtype)
+
+    key = ('annulus', diameter, inner_diameter, shape, centre,
+           numpy_dtype(dtype))
+    return _mask_cache.get(key, _make_annulus)
+
+
+def sector(diameter, angles, shape=None, centre=None, dtype=bool,
+           validate=None):
+    """Return a mask containing a sector of the disc of diameter 'diameter'.
+
+    The sector contains the central pixel and the pixels of the disc whose
+    direction from the central pixel is in the range [start, stop), where
+    angles = (start, stop) in degrees, measured anticlockwise from the
+    positive horizontal axis (i.e. rightwards, with upwards being 90
+    degrees). The sector can wrap around, for example angles=(350, 10).
+
+    The other arguments and conventions are the same as for disc(), and, as
+    with disc(), the returned array is cached and read-only.
+    """
+    diameter, radius, shape, centre = _mask_geometry(diameter, shape, centre,
+                                                     validate)
+    start, stop = _ensure_numeric_array(angles, shape=(2,), mode=validate)
+    # The angular width of the sector, where a width of 360 means the whole
+    # disc.
+    width = float(stop - start) % 360
+    if width == 0 and stop != start:
+        width = 360.
+    start = float(start) % 360
+
+    def _make_sector():
+        r2, v, h = _squared_distances(shape, centre)
+        # Upwards (decreasing row index) is a positive angle
+        theta = (degrees(arctan2(-v, h)) - start) % 360
+        inside = (r2 <= radius ** 2) & (theta < width)
+        if diameter > 0 and (0 <= centre[0] < shape[0]) and \
+                (0 <= centre[1] < shape[1]):
+            inside[centre] = True
+        return inside.astype(dtype)
+
+    key = ('sector', diameter, start, width, shape, centre,
+           numpy_dtype(dtype))
+    return _mask_cache.get(key, _make_sector)
+
+
+def band(thickness, angle, shape, centre=None, dtype=bool, validate=None):
+    """Return a mask with shape 'shape' containing a straight band, of
+    thickness 'thickness' pixels, through the pixel at array indices
+    'centre' and oriented at 'angle' degrees, measured anticlockwise from the
+    positive horizontal axis (as for sector()).
+
+    A pixel is inside the band if its signed distance t from the line through
+    the central pixel (increasing downwards when angle is 0) satisfies
+    -(thickness // 2) - 0.5 <= t < thickness - thickness // 2 - 0.5, so that a
+    horizontal band contains 'thickness' whole rows, and at other angles the
+    band contains the pixels within the same rectangle rotated about the
+    central pixel. The distance is evaluated directly for each pixel rather
+    than by rotating an image of the band, so the mask has no interpolation
+    error.
+
+    The 'centre' argument and conventions are the same as for disc(), and, as
+    with disc(), the returned array is cached and read-only.
+    """
+    # The diameter is only used by _mask_geometry() when there is no shape
+    _, _, shape, centre = _mask_geometry(0, shape, centre, validate)
+    thickness = max(_ensure_int(thickness), 0)
+    # A band at angle + 180 degrees is the same band
+    angle = float(angle) % 180
+    before = thickness // 2
+
+    def _make_band():
+        _, v, h = _squared_distances(shape, centre)
+        # Signed distance from the line, from the two (broadcast) coordinate
+        # arrays: h sin(angle) + v cos(angle)
+        t = h * sin(radians(angle)) + v * cos(radians(angle))
+        inside = (t >= -before - 0.5) & (t < thickness - before - 0.5)
+        return inside.astype(dtype)
+
+    key = ('band', thickness, angle, shape, centre, numpy_dtype(dtype))
+    return _mask_cache.get(key, _make_band)
+
+
+class AnimationWriter:
+    """Encode an animated GIF or APNG file one frame at a time.
+
+    Frames are encoded and written to the file as they are added, so that
+    only the previous frame is held in memory. Each frame is a 2D (greyscale)
+    or 3D (RGB or RGBA, alpha is ignored) ndarray; uint8 frames are written
+    as they are, and any other frames are converted as imsave_sc() would
+    convert them. Every frame must have the same shape.
+
+    Arguments
+    ---------
+    fname : str
+        The output filename. The format is 'gif' or 'apng' if 'fmt' is None,
+        chosen from the filename extension ('.gif', or '.png'/'.apng').
+    delay : int
+        Delay between frames in milliseconds.
+    loop : int
+        Number of times to play the animation, 0 meaning forever.
+    delta : bool
+        If True, then each frame after the first is encoded as the smallest
+        rectangle containing every pixel that differs from the previous
+        frame.
+    palette : str
+        For GIF files with RGB frames, 'adaptive' (default) quantises every
+        frame to a 256 colour palette computed from the first frame, and
+        'uniform' uses a fixed 3-3-2 bit RGB palette. Greyscale frames always
+        use a palette of 256 grey levels. Not used for APNG files.
+    fmt : str or None
+        'gif' or 'apng', or None to choose from the filename extension.
+
+    Use as a context manager, which calls close() on exit:
+
+        with AnimationWriter('anim.gif', delay=200) as writer:
+            for frame in frames:
+                writer.add_frame(frame)
+    """
+
+    def __init__(self, fname, delay=100, loop=0, delta=True,
+                 palette='adaptive', fmt=None):
+        if fmt is None:
+            ext = os.path.splitext(fname)[1].lower()
+            fmt = 'apng' if ext in ('.png', '.apng') else 'gif'
+        if fmt not in ('gif', 'apng'):
+            raise ValueError("Argument fmt should be 'gif' or 'apng'.")
+        if palette not in ('adaptive', 'uniform'):
+            raise ValueError("Argument palette should be 'adaptive' or " +
+                             "'uniform'.")
+        self.fname = fname
+        self.fmt = fmt
+        self.delay = _ensure_int(delay, min_val=0)
+        self.loop = _ensure_int(loop, min_val=0)
+        self.delta = delta
+        self.palette = palette
+        self.num_frames = 0
+        self._fp = open(fname, 'wb')
+        # The shape of the frames, whether they are RGB, and the previous
+        # (encoded) frame
+        self._shape = None
+        self._rgb = False
+        self._previous = None
+        # For an adaptive GIF palette, the 'P' mode image holding the palette
+        self._palette_image = None
+        # For APNG files, the file position of the acTL chunk (which holds the
+        # number of frames and is rewritten by close()) and the next chunk
+        # sequence number.
+        self._actl_position = None
+        self._sequence = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._fp is not None:
+            # Do not hide the original exception behind an error about the
+            # incomplete file.
+            self._fp.close()
+            self._fp = None
+
+    def add_frame(self, im):
+        """Encode the frame 'im' and append it to the file."""
+        if self._fp is None:
+            raise ValueError('Cannot add a frame to a closed ' +
+                             'AnimationWriter.')
+        im = asarray(im)
+        if im.dtype != uint8:
+            im = _as_uint8(im)
+        if im.ndim == 3:
+            # Ignore any alpha channel
+            im = im[:, :, :3]
+        if self._shape is None:
+            self._shape = im.shape
+            self._rgb = (im.ndim == 3)
+        elif im.shape != self._shape:
+            raise ValueError('Each frame should have shape ' +
+                             str(self._shape) + '.')
+        if self.fmt == 'gif':
+            # GIF frames are encoded as palette indices
+            im = self._gif_indices(im)
+        # The region of the frame to be encoded
+        if self.delta and self._previous is not None:
+            rows, cols = _changed_rectangle(self._previous, im)
+        else:
+            rows, cols = slice(0, im.shape[0]), slice(0, im.shape[1])
+        if self.num_frames == 0:
+            self._write_header(im)
+        if self.fmt == 'gif':
+            self._write_gif_frame(im[rows, cols], (cols.start, rows.start))
+        else:
+            self._write_apng_frame(im[rows, cols], (cols.start, rows.start))
+        self._previous = im
+        self.num_frames += 1
+
+    def close(self):
+        """Finish writing the file, and close it."""
+        if self._fp is None:
+            return
+        try:
+            if self.num_frames == 0:
+                raise ValueError('An animation needs at least one frame.')
+            if self.fmt == 'gif':
+                # GIF trailer
+                self._fp.write(b';')
+            else:
+                self._write_png_chunk(b'IEND', b'')
+                # Now that the number of frames is known, rewrite acTL
+                self._fp.seek(self._actl_position)
+                self._write_png_chunk(b'acTL', pack('>II', self.num_frames,
+                                                    self.loop))
+        finally:
+            self._fp.close()
+            self._fp = None
+
+    def _gif_indices(self, im):
+        """Return the palette indices (a 2D uint8 ndarray) of frame 'im'."""
+        if im.ndim == 2:
+            # Greyscale frames use a palette of grey levels, so the values
+            # are already palette indices.
+            return im
+        if self.palette == 'uniform':
+            # 3 bits of red, 3 bits of green, and 2 bits of blue
+            return ((im[:, :, 0] & 0xE0) | ((im[:, :, 1] & 0xE0) >> 3) |
+                    (im[:, :, 2] >> 6))
+        rgb = Image.fromarray(ascontiguousarray(im), 'RGB')
+        if self._palette_image is None:
+            # Choose the palette from the first frame
+            self._palette_image = rgb.quantize(256)
+            return asarray(self._palette_image)
+        return asarray(rgb.quantize(palette=self._palette_image,
+                                    dither=Image.Dither.NONE))
+
+    def _gif_palette(self):
+        """Return the GIF global colour table (256 RGB triples)."""
+        if self._palette_image is not None:
+            colours = self._palette_image.getpalette()[:768]
+            return bytes(colours) + bytes(768 - len(colours))
+        levels = arange(256)
+        if self._rgb:
+            # The fixed 3-3-2 bit RGB palette
+            colours = ((levels >> 5) * 255 // 7,
+                       ((levels >> 2) & 7) * 255 // 7,
+                       (levels & 3) * 255 // 3)
+        else:
+            # Grey levels
+            colours = (levels,) * 3
+        return stack(colours, axis=1).astype(uint8).tobytes()
+
+    def _write_header(self, im):
+        """Write the file header, given the first (encoded) frame."""
+        height, width = im.shape[:2]
+        if self.fmt == 'gif':
+            # Header, logical screen descriptor (with a global colour table
+            # of 256 colours), global colour table, and NETSCAPE2.0
+            # application extension for looping.
+            self._fp.write(b'GIF89a' + pack('<HHBBB', width, height, 0xF7, 0,
+                                             0))
+            self._fp.write(self._gif_palette())
+            self._fp.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' +
+                           pack('<H', self.loop) + b'\x00')
+        else:
+            colour_type = 2 if im.ndim == 3 else 0
+            self._fp.write(b'\x89PNG\r\n\x1a\n')
+            self._write_png_chunk(b'IHDR', pack('>IIBBBBB', width, height, 8,
+                                                colour_type, 0, 0, 0))
+            # The number of frames is not known yet, so remember where the
+            # acTL chunk is and rewrite it in close().
+            self._actl_position = self._fp.tell()
+            self._write_png_chunk(b'acTL', pack('>II', 0, self.loop))
+
+    def _write_gif_frame(self, indices, offset):
+        """Write a graphic control extension, image descriptor, and LZW
+        compressed image data for a (partial) frame of palette indices.
+        """
+        frame = Image.fromarray(ascontiguousarray(indices), 'L')
+        # Disposal method 1 leaves the previous frame in place, so that the
+        # delta rectangle is drawn on top of it.
+        for data in GifImagePlugin.getdata(frame, offset=offset,
+                                           duration=self.delay, disposal=1):
+            self._fp.write(data)
+
+    def _write_apng_frame(self, im, offset):
+        """Write a frame control chunk followed by the zlib compressed
+        (unfiltered) scanlines of a (partial) frame.
+        """
+        height, width = im.shape[:2]
+        # dispose_op 0 (none) and blend_op 0 (source) replace the rectangle
+        self._write_png_chunk(b'fcTL', pack('>IIIIIHHBB', self._sequence,
+                                            width, height, offset[0],
+                                            offset[1], self.delay, 1000, 0,
+                                            0))
+        self._sequence += 1
+        # Each scanline is preceded by its filter type (0, no filter)
+        rows = im.reshape(height, -1)
+        scanlines = zeros((height, rows.shape[1] + 1), dtype=uint8)
+        scanlines[:, 1:] = rows
+        data = zlib.compress(scanlines.tobytes())
+        if self.num_frames == 0:
+            self._write_png_chunk(b'IDAT', data)
+        else:
+            self._write_png_chunk(b'fdAT', pack('>I', self._sequence) + data)
+            self._sequence += 1
+
+    def _write_png_chunk(self, chunk_type, data):
+        self._fp.write(pack('>I', len(data)) + chunk_type + data +
+                       pack('>I', zlib.crc32(chunk_type + data)))
+
+
+def _changed_rectangle(previous, im):
+    """Return the smallest rectangle (a pair of slices) that contains every
+    pixel that differs between frames 'previous' and 'im'. If no pixels
+    differ, return a rectangle containing only the top left pixel.
+    """
+    changed = (previous != im)
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    rows = changed.any(axis=1).nonzero()[0]
+    if len(rows) == 0:
+        return slice(0, 1), slice(0, 1)
+    cols = changed.any(axis=0).nonzero()[0]
+    return (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+
+
+def write_animation(fname, frames, **keywords):
+    """Write the frames (a sequence or generator of ndarrays) to an animated
+    GIF or APNG file. Frames are consumed one at a time, so a generator does
+    not need to hold every frame in memory.
+
+    Keyword arguments are passed to AnimationWriter. Returns the number of
+    frames written.
+    """
+    with AnimationWriter(fname, **keywords) as writer:
+        for frame in frames:
+            writer.add_frame(frame)
+    return writer.num_frames
 
 
 def create_animated_gif(fname,
@@ -491,8 +1716,9 @@ def create_animated_gif(fname,
                         quiet_on_success=False):
     """Create an animated GIF from a list of image filenames.
 
-    This function requires the ImageMagick package to be installed which
-    includes the "convert" command.
+    The frames are read one at a time and encoded in-process by
+    AnimationWriter (previously, this function required ImageMagick's
+    "convert" command).
 
     If fname is a string, then it is assumed that the list of filenames is
     (fname+str(start)+'.png', fname+str(start+1)+'.png', ...,
@@ -508,12 +1734,11 @@ def create_animated_gif(fname,
     is not None) or else it will be fname+'.gif' (if fname is a string) or
     else it will be fnames[0]+'_anim.gif'.
 
-    quiet_on_success is a flag used to supress printing a status message is
-    the call to ImageMagick's convert is successful.
-    """
-    # The ImageMagick "convert" command as recognised by the operating system
-    convert_cmd = 'convert'
+    quiet_on_success is a flag used to supress printing a status message if
+    the animated GIF is created successfully.
 
+    Returns 0 if successful, or -1 otherwise.
+    """
     # Ensure fname is a list of filename strings
     if isinstance(fname, str):
         fnames = [fname + str(a) + '.png' for a in range(start, stop)]
@@ -526,24 +1751,40 @@ def create_animated_gif(fname,
             out_fname = fname
         else:
             out_fname = fnames[0] + '_anim'
-    # Convert the delay from units of milliseconds into units of centiseconds
-    # as expected by ImageMagick.
-    delay = int(ceil(delay / 10))
-    # Create a list of tokens that will be separated by spaces when used as
-    # command line arguments.
     out_fname += '.gif'
-    args = ["-delay", str(delay)] + fnames + [out_fname]
-    # Call a program external to Python
+    # GIF delays are in units of centiseconds, as they were for ImageMagick
+    delay = int(ceil(delay / 10)) * 10
     try:
-        retcode = subprocess.check_call([convert_cmd] + args)
+        write_animation(out_fname, (io.imread(f) for f in fnames),
+                        delay=delay, fmt='gif')
+        retcode = 0
         if not quiet_on_success:
             print('Animated GIF "' + out_fname + '" created.')
-    except FileNotFoundError:
+    except (OSError, ValueError) as e:
         retcode = -1
-        print('File not found error executing command "' + convert_cmd +
-              '". Have you installed ImageMagick?')
-    except subprocess.CalledProcessError as e:
-        retcode = e.returncode
-        print('Unable to create file "' + out_fname +
-              '" (ImageMagick returned error code: ' + str(retcode) + ').')
+        print('Unable to create file "' + out_fname + '" (' + str(e) + ').')
     return retcode
+
+
+def _benchmark_validation(sizes=(256, 2048)):
+    """Print the time taken by one call of _check_numeric_array() and of
+    window_2d() (a crop) in each validation mode, for square arrays of
+    random floats with the given side lengths.
+
+    Run with: python imageutilssubset.py
+    """
+    from timeit import timeit
+    from numpy import random
+    for n in sizes:
+        a = random.rand(n, n)
+        for mode in VALIDATION_MODES:
+            t = timeit(lambda: _check_numeric_array(a, min_val=0, mode=mode),
+                       number=1)
+            print(n, mode, 'check:', t)
+            t = timeit(lambda: window_2d(a, (n // 2, n // 2), validate=mode),
+                       number=1)
+            print(n, mode, 'window_2d:', t)
+
+
+if __name__ == '__main__':
+    _benchmark_validation()
@@ -15,6 +15,8 @@ tjn, CS, MU, 22 X 2015, relocated add_impulse() to here
 tjn, CS, MU, 11 XI 2015, fix both 0 and 2pi appearing in phase plots due to
     precision/rounding errors
 tjn, CS, MU, 22 X 2020, adapt for PythonAnywhere and Jupyter Notebook
+tjn, 16 X 2026, sinusoid_bank() computes the sinusoids of many parameter sets
+    at once; plot_sinusoid() plots its result
 
 Tested with Python 3.7.3 on Jupyter Notebook 6.0.3.
 
@@ -27,10 +29,12 @@ and under "Graphics backend" change the "Backend" selection from "Inline" to
 "Automatic".
 """
 
+from functools import lru_cache
 from math import floor, ceil
-from numpy import (arange, zeros, sum, real, imag, angle, linspace, pi,
-                   isscalar, rint)
-from scipy.fftpack import ifft, ifftshift
+from numpy import (arange, zeros, real, imag, angle, linspace, pi,
+                   isscalar, rint, asarray, broadcast_arrays, add, exp, conj,
+                   empty, multiply, remainder)
+from scipy.fftpack import ifft, ifftshift, next_fast_len
 from scipy import absolute as abs
 import matplotlib
 
@@ -79,6 +83,103 @@ def add_impulse(x, a, freq, ampl):
     return a
 
 
+def sinusoid_bank(ocd=1, A=1, d=(-1j, 1j), M=1024, direct=None):
+    """Compute (without plotting) the impulses and sinusoids of
+    plot_sinusoid() for K sets of parameters at once.
+
+    Parameters
+    ----------
+
+    ocd : int, seq of ints, or 2D array of ints, optional, default 1
+        As for plot_sinusoid(), or an array of shape (K, P) of the P
+        off-centre distances of each of the K sets of parameters.
+
+    A : real, or array of reals, optional, default 1
+        As for plot_sinusoid(), or an array that broadcasts to the shape
+        (K, P) of ocd.
+
+    d : seq of complex, or array of complex, optional, default (-1j, 1j)
+        As for plot_sinusoid(), or an array that broadcasts to the shape
+        (K, P, 2), holding a pair of impulse values for each distance.
+
+    M : int, optional, default 1024
+        Length of the arrays.
+
+    direct : bool or None, optional, default None
+        If True, sum the complex exponentials (cosines and sines) of the
+        impulses directly, from a cached table of their values; if False,
+        use one inverse FFT for all K impulse arrays. If None, use direct
+        synthesis when it is the faster: when there are at most two pairs
+        of impulses (P <= 2) and M has a prime factor larger than 5.
+
+    Returns
+    -------
+
+    a, s : ndarrays of shape (K, M)
+        The impulse arrays (centred on index M // 2) and their inverse
+        Fourier transforms, as plotted by plot_sinusoid().
+    """
+    # Give ocd the shape (K, P), and A and d the shapes (K, P) and (K, P, 2),
+    # treating one set of parameters as plot_sinusoid() does
+    ocd = asarray(ocd)
+    ocd = ocd.reshape((1,) * (2 - ocd.ndim) + ocd.shape)
+    A = asarray(A, dtype=float)
+    A = A.reshape((1,) * (2 - A.ndim) + A.shape)
+    d = asarray(d, dtype=complex)
+    d = d.reshape((1,) * (3 - d.ndim) + d.shape)
+    ocd, A, d0, d1 = broadcast_arrays(ocd, A, d[..., 0], d[..., 1])
+    rows = arange(ocd.shape[0])[:, None].repeat(ocd.shape[1], axis=1)
+
+    # Add pairs of impulse functions symmetrically about the origin, with
+    # the amplitudes that give each sinusoid an amplitude of A (see
+    # plot_sinusoid()). add.at() accumulates impulses at the same index.
+    origin = M // 2
+    ascaling = (abs(d0) + abs(d1)) / M / A
+    a = zeros((ocd.shape[0], M), dtype=complex)
+    add.at(a, (rows, origin - ocd), d0 / ascaling)
+    add.at(a, (rows, origin + ocd), d1 / ascaling)
+
+    if direct is None:
+        # A pair of impulses costs about as much to synthesise directly as
+        # an FFT of length M = 2^16. scipy.fftpack is several times slower
+        # when M is not a product of 2s, 3s, and 5s.
+        direct = ocd.shape[1] <= 2 and next_fast_len(M) != M
+    if not direct:
+        return a, ifft(ifftshift(a, axes=-1), axis=-1)
+
+    # The impulses at origin - ocd and origin + ocd have spatial frequencies
+    # -ocd and ocd, and contribute (d0 / ascaling) exp(-i theta) / M and
+    # (d1 / ascaling) exp(i theta) / M to the sinusoid, where
+    # theta = 2 pi ocd n / M, and exp(i theta) = cos(theta) + i sin(theta)
+    # is looked up in a table. Each sinusoid is summed in buffers of length
+    # M that stay in the CPU cache.
+    roots = _roots_of_unity(M)
+    n = arange(M)
+    index = empty(M, dtype=int)
+    w = empty(M, dtype=complex)
+    term = empty(M, dtype=complex)
+    s = zeros((ocd.shape[0], M), dtype=complex)
+    for k in range(ocd.shape[0]):
+        for p in range(ocd.shape[1]):
+            multiply(n, ocd[k, p], out=index)
+            remainder(index, M, out=index)
+            roots.take(index, out=w)
+            multiply(w, d1[k, p] / ascaling[k, p] / M, out=term)
+            s[k] += term
+            conj(w, out=w)
+            w *= d0[k, p] / ascaling[k, p] / M
+            s[k] += w
+    return a, s
+
+
+@lru_cache(maxsize=4)
+def _roots_of_unity(M):
+    """Return the (read-only) array exp(2 pi i n / M) for n = 0..M-1."""
+    roots = exp(2j * pi * arange(M) / M)
+    roots.setflags(write=False)
+    return roots
+
+
 def plot_sinusoid(ocd=1, A=1, d=(-1j, 1j), M=1024, figs='a'):
     """A function to create and plot the sum of arbitrary sinusoids.
 
@@ -153,6 +254,11 @@ def plot_sinusoid(ocd=1, A=1, d=(-1j, 1j), M=1024, figs='a'):
         ocd = (ocd,)
         A = (A,)
         d = (d,)
+    # Each off-centre distance needs its own amplitude and pair of impulse
+    # values
+    if not len(ocd) == len(A) == len(d):
+        raise ValueError('Arguments ocd, A, and d should have the same ' +
+                         'length.')
 
     # If user specifies something other than the empty string to indicate that
     # no figures should be displayed, accommodate that.
@@ -161,20 +267,16 @@ def plot_sinusoid(ocd=1, A=1, d=(-1j, 1j), M=1024, figs='a'):
 
     # Horizontal axis for plotting (centred on zero)
     x = arange(-1 * floor(M / 2.0), ceil(M / 2.0), dtype='int')
-    # Centre index of an array with indices 0..M-1
-    origin = M // 2
-    # Create 1D complex-valued array of zeros
-    a = zeros(M, dtype=complex)
 
-    # Add pairs of impulse functions symmetrically about the origin.
+    # Add pairs of impulse functions symmetrically about the origin, and
+    # Fourier transform them.
     # Set their amplitudes to ensure a particular resulting sinusoid amplitude
     # of A. In the scipy.fftpack implementation of ifft2(), the amplitude of
     # the sinusoid will be sum(abs(a))/len(a) by default, where a is the
-    # impulse list.
-    for dval, Aval, freq in zip(d, A, ocd):
-        ascaling = sum(abs(dval)) / len(a) / Aval
-        a[origin - freq] += (dval[0] / ascaling)
-        a[origin + freq] += (dval[1] / ascaling)
+    # impulse list. Always use the inverse FFT, which reproduces the values
+    # of the original implementation exactly.
+    a, A = sinusoid_bank(ocd, A, d, M, direct=False)
+    a, A = a[0], A[0]
 
     # Plot the impulse functions
     if 'a' in figs:
@@ -187,9 +289,6 @@ def plot_sinusoid(ocd=1, A=1, d=(-1j, 1j), M=1024, figs='a'):
         quick_plot(x, angle(a), 'o-', title='Phase'+titlestr, xlabel=xstr,
                    ylabel='radians', ylims=(-pi, pi))
 
-    # Fourier transform the impulse functions
-    A = ifft(ifftshift(a))
-
     # Create the horizontal axis for plotting in multiples of pi radians
     # (centred on zero) for easy comprehension (set to 1xpi each side of the
     # origin).
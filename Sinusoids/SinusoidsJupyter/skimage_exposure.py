@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 
 # For integers Numpy uses `_integer_types` basis internally, and builds a leaky
@@ -49,17 +51,29 @@ def intensity_range(image, range_values='image', clip_negative=False):
             reason to use this function if you just want to specify the
             intensity range explicitly. This option is included for functions
             that use `intensity_range` to support all desired range types.
+        ('pct', low, high) or ('pct', low, high, sketch)
+            Return the `low` and `high` percentiles (in the range [0, 100]) of
+            the image intensities as the range, estimated from a
+            `HistogramSketch` rather than by sorting. If `sketch` is given
+            (for example, one merged from the tiles or frames of a larger
+            image), it is used and `image` is ignored.
 
     clip_negative : bool, optional
         If True, clip the negative range (i.e. return 0 for min intensity)
         even if the image dtype allows negative values.
     """
+    if _is_percentile_range(range_values):
+        if len(range_values) > 3:
+            sketch = range_values[3]
+        else:
+            sketch = HistogramSketch.of(image)
+        return tuple(sketch.percentile(range_values[1:3]))
+
     if range_values == 'dtype':
         range_values = image.dtype.type
 
     if range_values == 'image':
-        i_min = np.min(image)
-        i_max = np.max(image)
+        i_min, i_max = _image_min_max(image)
     elif range_values in DTYPE_RANGE:
         i_min, i_max = DTYPE_RANGE[range_values]
         if clip_negative:
@@ -69,7 +83,206 @@ def intensity_range(image, range_values='image', clip_negative=False):
     return i_min, i_max
 
 
-def rescale_intensity(image, in_range='image', out_range='dtype'):
+def _is_percentile_range(range_values):
+    """Return True if `range_values` is a ('pct', low, high[, sketch]) tuple.
+    """
+    return (isinstance(range_values, tuple) and len(range_values) in (3, 4)
+            and isinstance(range_values[0], str) and range_values[0] == 'pct')
+
+
+class HistogramSketch:
+    """A histogram summarising the distribution of image intensities, from
+    which percentiles can be estimated without sorting the image.
+
+    Sketches with the same binning can be merged, so a sketch of a large
+    image (or of a sequence of frames) can be built from sketches of its
+    tiles (or frames), possibly computed in parallel.
+
+    Parameters
+    ----------
+    bins : int, optional
+        Number of equal-width bins, for linear binning.
+    value_range : 2-tuple, optional
+        (min, max) of the linear bins. If None, the min/max of the first
+        image added is used; values added later that fall outside the range
+        are counted in the first or last bin.
+    log : bool, optional
+        If True, use logarithmically spaced bins, suitable for nonnegative
+        data with a high dynamic range (such as Fourier amplitudes). These
+        bins cover every positive value, so sketches can always be merged.
+        Values <= 0 are counted as 0.
+    bins_per_octave : int, optional
+        Resolution of logarithmic bins: each bin spans a factor of
+        2 ** (1 / bins_per_octave) (about 1.1% for the default of 64).
+    """
+
+    def __init__(self, bins=4096, value_range=None, log=False,
+                 bins_per_octave=64):
+        self.bins = bins
+        self.value_range = value_range
+        self.log = log
+        self.bins_per_octave = bins_per_octave
+        self.counts = None
+        # Index of the first logarithmic bin in `counts`
+        self.offset = 0
+        # Number of values <= 0 (logarithmic bins only)
+        self.zeros = 0
+        self.min = None
+        self.max = None
+
+    @classmethod
+    def of(cls, image, **kwargs):
+        """Return a sketch of `image`, with logarithmic bins if `image` has
+        no negative values, and linear bins otherwise.
+        """
+        imin, imax = _image_min_max(image)
+        if 'log' not in kwargs:
+            kwargs['log'] = (imin >= 0)
+        return cls(**kwargs).add(image, (imin, imax))
+
+    @property
+    def count(self):
+        """The number of values summarised by the sketch."""
+        if self.counts is None:
+            return self.zeros
+        return int(self.counts.sum()) + self.zeros
+
+    def add(self, image, min_max=None):
+        """Add the intensities of `image` to the sketch, and return the
+        sketch. `min_max` is the (min, max) of `image`, if already known.
+        """
+        image = np.asarray(image)
+        if min_max is None:
+            min_max = _image_min_max(image)
+        imin, imax = (float(v) for v in min_max)
+        self.min = imin if self.min is None else min(self.min, imin)
+        self.max = imax if self.max is None else max(self.max, imax)
+        if self.log:
+            # Single precision logarithms are ample for the bin resolution
+            positive = image if imin > 0 else image[image > 0]
+            self.zeros += image.size - positive.size
+            if positive.size:
+                index = np.log2(positive.reshape(-1), dtype=np.float32)
+                index *= self.bins_per_octave
+                low = imin if imin > 0 else positive.min()
+                offset = int(np.floor(np.log2(low) * self.bins_per_octave))
+                index -= offset
+                np.clip(index, 0, None, out=index)
+                counts = np.bincount(index.astype(np.intp))
+                self._add_counts(counts, offset)
+        else:
+            if self.value_range is None:
+                self.value_range = (imin, imax)
+            lo, hi = self.value_range
+            width = (hi - lo) / self.bins if hi > lo else 1.
+            index = np.subtract(image, lo, dtype=np.float64).reshape(-1)
+            index /= width
+            np.clip(index, 0, self.bins - 1, out=index)
+            counts = np.bincount(index.astype(np.intp), minlength=self.bins)
+            self._add_counts(counts, 0)
+        return self
+
+    def _add_counts(self, counts, offset):
+        """Add the bin `counts`, the first of which has index `offset`."""
+        if self.counts is None:
+            self.counts, self.offset = counts.astype(np.int64), offset
+            return
+        start = min(self.offset, offset)
+        stop = max(self.offset + self.counts.size, offset + counts.size)
+        if (start, stop) != (self.offset, self.offset + self.counts.size):
+            # Extend the range of bins
+            extended = np.zeros(stop - start, dtype=np.int64)
+            extended[self.offset - start:
+                     self.offset - start + self.counts.size] = self.counts
+            self.counts, self.offset = extended, start
+        self.counts[offset - start:offset - start + counts.size] += counts
+
+    def merge(self, other):
+        """Add the counts of another sketch with the same binning to this
+        sketch, and return this sketch.
+        """
+        if (self.log != other.log or
+                (self.log and self.bins_per_octave != other.bins_per_octave)
+                or (not self.log and self.counts is not None and
+                    other.counts is not None and
+                    (self.bins, self.value_range) !=
+                    (other.bins, other.value_range))):
+            raise ValueError('Sketches with different bins cannot be merged')
+        if other.counts is not None:
+            if self.value_range is None:
+                self.value_range = other.value_range
+            self._add_counts(other.counts, other.offset)
+        self.zeros += other.zeros
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+        return self
+
+    def _bin_value(self, position):
+        """Convert a (fractional) bin position in `counts` to a value."""
+        if self.log:
+            return 2. ** ((self.offset + position) / self.bins_per_octave)
+        lo, hi = self.value_range
+        return lo + position * (hi - lo) / self.bins
+
+    def percentile(self, q):
+        """Return the estimated `q`th percentile(s) (0 <= q <= 100) of the
+        intensities, interpolating linearly (or geometrically, for
+        logarithmic bins) within a bin.
+        """
+        if self.count == 0:
+            raise ValueError('Cannot estimate percentiles of an empty sketch')
+        q = np.asarray(q, dtype=np.float64)
+        rank = q / 100 * self.count
+        cdf = np.cumsum(self.counts) if self.counts is not None else [0]
+        cdf = np.asarray(cdf, dtype=np.float64) + self.zeros
+        result = []
+        for r in np.atleast_1d(rank):
+            if r <= self.zeros:
+                value = 0.
+            else:
+                i = min(int(np.searchsorted(cdf, r)), len(cdf) - 1)
+                before = cdf[i - 1] if i > 0 else self.zeros
+                fraction = (r - before) / max(cdf[i] - before, 1)
+                value = self._bin_value(i + fraction)
+            # The estimate cannot lie outside the observed values
+            result.append(min(max(value, self.min), self.max))
+        return result[0] if q.ndim == 0 else result
+
+
+def _image_min_max(image, chunk_size=2 ** 16):
+    """Return the (min, max) of `image`, reading its values from memory once.
+
+    Both reductions are applied to each chunk of `chunk_size` elements while
+    the chunk is still in the CPU cache, rather than making two full passes
+    over a large image.
+
+    As for ``image.min()`` and ``image.max()``, a NaN anywhere in `image`
+    makes both values NaN.
+
+    Examples
+    --------
+    >>> print(*_image_min_max(np.array([0., 1., np.nan, 2.]), chunk_size=2))
+    nan nan
+    >>> print(*_image_min_max(np.array([3, 1, 4, 1, 5]), chunk_size=2))
+    1 5
+    """
+    if image.size <= chunk_size or not image.flags.c_contiguous:
+        return np.min(image), np.max(image)
+    flat = image.reshape(-1)
+    i_min = i_max = flat[0]
+    for start in range(0, flat.size, chunk_size):
+        chunk = flat[start:start + chunk_size]
+        # np.minimum() and np.maximum() propagate NaN, whereas the builtin
+        # min() and max() depend on the order of their arguments
+        i_min = np.minimum(i_min, chunk.min())
+        i_max = np.maximum(i_max, chunk.max())
+    return i_min, i_max
+
+
+def rescale_intensity(image, in_range='image', out_range='dtype', out=None,
+                      inplace=False, precision=np.float32):
     """Return image after stretching or shrinking its intensity levels.
 
     The desired intensity range of the input and output, `in_range` and
@@ -93,12 +306,27 @@ def rescale_intensity(image, in_range='image', out_range='dtype'):
             in `DTYPE_RANGE`.
         2-tuple
             Use `range_values` as explicit min/max intensities.
+    out : array, optional
+        Array in which to place the result (with the same shape as `image`).
+        Values are cast to the dtype of `out`, and `out` is returned.
+    inplace : bool, optional
+        If True, `image` itself is overwritten with the result (equivalent to
+        ``out=image``).
+    precision : dtype, optional
+        The floating point type used for the intermediate calculations,
+        either np.float32 (default) or np.float64.
 
     Returns
     -------
     out : array
         Image array after rescaling its intensity. This image is the same dtype
-        as the input image.
+        as the input image (or the dtype of `out`, if passed).
+
+    Notes
+    -----
+    uint8 and uint16 images (with at least 256 or 65536 pixels, respectively)
+    are mapped through a lookup table, cached for each combination of ranges
+    and dtypes, which gives the same result as the floating point arithmetic.
 
     See Also
     --------
@@ -145,20 +373,560 @@ def rescale_intensity(image, in_range='image', out_range='dtype'):
 
     """
     dtype = image.dtype.type
-
-    imin, imax = intensity_range(image, in_range)
+    precision = np.dtype(precision)
+    if precision not in (np.float32, np.float64):
+        raise ValueError('precision must be np.float32 or np.float64')
+    if inplace:
+        out = image
+
+    if isinstance(in_range, str) and in_range == 'image':
+        imin, imax = _image_min_max(image)
+    else:
+        imin, imax = intensity_range(image, in_range)
     omin, omax = intensity_range(image, out_range, clip_negative=(imin >= 0))
 
-    image = np.clip(image, imin, imax)
+    # Clipping is only required when the input range does not come from the
+    # image itself.
+    clip = not (isinstance(in_range, str) and in_range == 'image')
+    if _uses_lut(image):
+        out_dtype = dtype if out is None else out.dtype.type
+        table = _rescale_table(dtype, imin, imax, omin, omax, out_dtype,
+                               precision, clip)
+        return apply_lut(image, table, out)
+    return _rescale(image, imin, imax, omin, omax, out, precision, clip)
 
+
+def _rescale(image, imin, imax, omin, omax, out, precision, clip):
+    """Map [imin, imax] to [omin, omax] with floating point arithmetic of
+    the given precision, returning `out` or an array of the image's dtype.
+    """
+    # Calculate directly in `out` when it has the working precision, so that
+    # no temporary array is needed; otherwise use one temporary array.
+    if out is not None and out.dtype == precision:
+        work = out
+    else:
+        work = np.empty(image.shape, dtype=precision)
+
+    # Clipping is applied after subtracting imin, which is equivalent to
+    # clipping the image to [imin, imax] beforehand.
     if imin != imax:
         # image = (image - imin) / float(imax - imin)
-        image = (
-            np.subtract(image, imin, dtype=np.float32)
-            / np.subtract(imax, imin, dtype=np.float32))
+        np.subtract(image, imin, out=work, dtype=precision)
+        span = np.subtract(imax, imin, dtype=precision)
+        if clip:
+            np.clip(work, 0, span, out=work)
+        work /= span
+    elif clip:
+        np.clip(image, imin, imax, out=work, dtype=precision)
+    else:
+        work[...] = image
     # return np.asarray(image * (omax - omin) + omin, dtype=dtype)
-    return np.asarray(
-        image
-        * np.subtract(omax, omin, dtype=np.float32)
-        + omin, dtype=dtype)
+    work *= np.subtract(omax, omin, dtype=precision)
+    work += omin
+
+    if work is out:
+        return out
+    elif out is not None:
+        np.copyto(out, work, casting='unsafe')
+        return out
+    return work.astype(image.dtype, copy=False)
+
+
+# Integer dtypes whose every value can be mapped through a lookup table. An
+# image of one of these dtypes with at least as many pixels as the table has
+# entries is mapped with a single `take` rather than with floating point
+# arithmetic for every pixel.
+_LUT_DTYPES = (np.uint8, np.uint16)
+
+
+def _uses_lut(image):
+    """Return True if `image` is mapped through a lookup table."""
+    return (image.dtype.type in _LUT_DTYPES and
+            image.size >= np.iinfo(image.dtype).max + 1)
+
+
+def _table_values(dtype):
+    """Return every value of the integer `dtype`, in order."""
+    return np.arange(np.iinfo(dtype).max + 1, dtype=dtype)
+
+
+@lru_cache(maxsize=64)
+def _rescale_table(dtype, imin, imax, omin, omax, out_dtype, precision, clip):
+    """Return the (read only) lookup table for rescale_intensity()."""
+    table = _rescale(_table_values(dtype), imin, imax, omin, omax,
+                     np.empty(np.iinfo(dtype).max + 1, dtype=out_dtype),
+                     precision, clip)
+    table.setflags(write=False)
+    return table
+
 
+@lru_cache(maxsize=64)
+def _curve_table(dtype, curve, args):
+    """Return the (read only) lookup table for `curve` with `args`."""
+    table = curve(_table_values(dtype), *args).astype(dtype)
+    table.setflags(write=False)
+    return table
+
+
+def apply_lut(image, table, out=None, chunk_size=2 ** 16):
+    """Return the values of an unsigned integer `image` mapped through the
+    lookup `table` (table[image]), in `out` if given.
+
+    The image is mapped in chunks of `chunk_size` values, converting each
+    chunk to indices in a small buffer that stays in the CPU cache, rather
+    than into a temporary index array the size of the image. Because each
+    chunk is read before it is written, `out` may be `image` itself.
+    """
+    if (out is not None and out.dtype == table.dtype and
+            out.flags.c_contiguous):
+        result = out
+    else:
+        result = np.empty(image.shape, dtype=table.dtype)
+    flat = np.ascontiguousarray(image).reshape(-1)
+    flat_result = result.reshape(-1)
+    index = np.empty(min(chunk_size, flat.size), dtype=np.intp)
+    for start in range(0, flat.size, chunk_size):
+        chunk = flat[start:start + chunk_size]
+        chunk_index = index[:chunk.size]
+        chunk_index[...] = chunk
+        # All indices are in range, so skip the bounds checks
+        np.take(table, chunk_index, out=flat_result[start:start + chunk_size],
+                mode='clip')
+    if out is not None and result is not out:
+        np.copyto(out, result, casting='unsafe')
+        return out
+    return result
+
+
+def clear_lut_cache():
+    """Discard the cached lookup tables for integer images."""
+    _rescale_table.cache_clear()
+    _curve_table.cache_clear()
+
+
+def _apply_curve(image, curve, *args):
+    """Return `curve(image, *args)` cast to the image's dtype, using a lookup
+    table for uint8 and uint16 images.
+    """
+    if _uses_lut(image):
+        return apply_lut(image, _curve_table(image.dtype.type, curve, args))
+    return curve(image, *args).astype(image.dtype.type)
+
+
+def _assert_non_negative(image):
+    if np.any(image < 0):
+        raise ValueError('Image Correction methods work correctly only on '
+                         'images with non-negative values. Use '
+                         'skimage.exposure.rescale_intensity.')
+
+
+def _gamma_curve(image, gamma, gain, scale):
+    return ((image / scale) ** gamma) * scale * gain
+
+
+def adjust_gamma(image, gamma=1, gain=1):
+    """Performs Gamma Correction on the input image.
+
+    Also known as Power Law Transform.
+    This function transforms the input image pixelwise according to the
+    equation ``O = I**gamma`` after scaling each pixel to the range 0 to 1.
+
+    Parameters
+    ----------
+    image : ndarray
+        Input image.
+    gamma : float, optional
+        Non negative real number. Default value is 1.
+    gain : float, optional
+        The constant multiplier. Default value is 1.
+
+    Returns
+    -------
+    out : ndarray
+        Gamma corrected output image.
+
+    See Also
+    --------
+    adjust_sigmoid
+
+    Notes
+    -----
+    For gamma greater than 1, the histogram will shift towards left and
+    the output image will be darker than the input image.
+
+    For gamma less than 1, the histogram will shift towards right and
+    the output image will be brighter than the input image.
+
+    uint8 and uint16 images are mapped through a cached lookup table.
+    """
+    _assert_non_negative(image)
+    if gamma < 0:
+        raise ValueError('Gamma should be a non-negative real number.')
+    imin, imax = intensity_range(image, 'dtype', clip_negative=True)
+    return _apply_curve(image, _gamma_curve, gamma, gain, float(imax - imin))
+
+
+def _sigmoid_curve(image, cutoff, gain, inv, scale):
+    out = 1 / (1 + np.exp(gain * (cutoff - image / scale)))
+    if inv:
+        out = 1 - out
+    return out * scale
+
+
+def adjust_sigmoid(image, cutoff=0.5, gain=10, inv=False):
+    """Performs Sigmoid Correction on the input image.
+
+    Also known as Contrast Adjustment.
+    This function transforms the input image pixelwise according to the
+    equation ``O = 1/(1 + exp*(gain*(cutoff - I)))`` after scaling each pixel
+    to the range 0 to 1.
+
+    Parameters
+    ----------
+    image : ndarray
+        Input image.
+    cutoff : float, optional
+        Cutoff of the sigmoid function that shifts the characteristic curve
+        in horizontal direction. Default value is 0.5.
+    gain : float, optional
+        The constant multiplier in exponential's power of sigmoid function.
+        Default value is 10.
+    inv : bool, optional
+        If True, returns the negative sigmoid correction. Defaults to False.
+
+    Returns
+    -------
+    out : ndarray
+        Sigmoid corrected output image.
+
+    See Also
+    --------
+    adjust_gamma
+
+    Notes
+    -----
+    uint8 and uint16 images are mapped through a cached lookup table.
+    """
+    _assert_non_negative(image)
+    imin, imax = intensity_range(image, 'dtype', clip_negative=True)
+    return _apply_curve(image, _sigmoid_curve, cutoff, gain, inv,
+                        float(imax - imin))
+
+
+# The axes reduced to find the intensity range of a (N, H, W) or (N, H, W, C)
+# stack, for each mode of rescale_stack(). None means all axes.
+_STACK_AXES = {'global': (None, None),
+               'frame': ((1, 2), (1, 2, 3)),
+               'channel': (None, (0, 1, 2)),
+               'frame_channel': ((1, 2), (1, 2))}
+
+
+def _rescale_by_ranges(image, imin, imax, omin, omax, out, precision, clip):
+    """Map [imin, imax] to [omin, omax], where imin and imax are arrays that
+    broadcast against `image` (one range per frame or channel, for example).
+
+    Where imin == imax, values are mapped to omin.
+    """
+    if out is not None and out.dtype == precision:
+        work = out
+    else:
+        work = np.empty(image.shape, dtype=precision)
+    np.subtract(image, imin, out=work, dtype=precision)
+    span = np.subtract(imax, imin, dtype=precision)
+    # Avoid dividing by zero for constant frames/channels
+    span[span == 0] = 1
+    if clip:
+        np.clip(work, 0, span, out=work)
+    work /= span
+    work *= np.subtract(omax, omin, dtype=precision)
+    work += omin
+    if work is out:
+        return out
+    elif out is not None:
+        np.copyto(out, work, casting='unsafe')
+        return out
+    return work.astype(image.dtype.type, copy=False)
+
+
+def rescale_stack(stack, mode='frame', out_range='dtype', out=None,
+                  precision=np.float32):
+    """Rescale the intensity of a stack of images.
+
+    Parameters
+    ----------
+    stack : array
+        Stack of greyscale (N, H, W) or colour (N, H, W, C) images.
+    mode : str, optional
+        Which values share an input intensity range (min, max), which is
+        stretched to `out_range`:
+
+        'global'
+            The whole stack.
+        'frame'
+            Each frame (default).
+        'channel'
+            Each channel, across every frame (colour stacks only).
+        'frame_channel'
+            Each channel of each frame (colour stacks only).
+    out_range : str or 2-tuple, optional
+        Output intensity range, as for `rescale_intensity`.
+    out : array, optional
+        Array in which to place the result (with the same shape as `stack`).
+    precision : dtype, optional
+        Floating point type for the intermediate calculations.
+
+    Returns
+    -------
+    out : array
+        The rescaled stack, with the same dtype as `stack` (or the dtype of
+        `out`, if passed). Frames or channels of constant intensity are set
+        to the minimum of `out_range`.
+
+    See Also
+    --------
+    rescale_intensity, rescale_frames
+    """
+    if stack.ndim not in (3, 4):
+        raise ValueError('stack must have shape (N, H, W) or (N, H, W, C)')
+    if mode not in _STACK_AXES:
+        raise ValueError('mode must be one of ' + str(tuple(_STACK_AXES)))
+    axes = _STACK_AXES[mode][stack.ndim - 3]
+    if axes is None and mode != 'global':
+        raise ValueError("mode '" + mode + "' requires a colour stack")
+    precision = np.dtype(precision)
+    # The min and max of each group are calculated with one vectorised
+    # reduction each, keeping the reduced axes for broadcasting.
+    imin = np.min(stack, axis=axes, keepdims=True)
+    imax = np.max(stack, axis=axes, keepdims=True)
+    omin, omax = intensity_range(stack, out_range,
+                                 clip_negative=(imin.min() >= 0))
+    return _rescale_by_ranges(stack, imin, imax, omin, omax, out, precision,
+                              clip=False)
+
+
+class StreamingRescaler:
+    """Rescale the intensity of a sequence of frames of unknown length.
+
+    Each frame passed to `rescale` is rescaled from an input range that is
+    updated as frames arrive, so a video-like sequence can be normalised
+    without all of its frames being in memory at once.
+
+    Parameters
+    ----------
+    out_range : str or 2-tuple, optional
+        Output intensity range, as for `rescale_intensity`.
+    mode : str, optional
+        'running' (default) uses the min and max of every frame seen so
+        far. 'ema' uses an exponential moving average of the min and max of
+        each frame, so that the range adapts to changes in the sequence.
+        Values outside the range are clipped.
+    alpha : float, optional
+        Weight of the newest frame in 'ema' mode, in the range (0, 1].
+    per_channel : bool, optional
+        If True, keep a separate range for each channel of colour (H, W, C)
+        frames.
+    precision : dtype, optional
+        Floating point type for the intermediate calculations.
+    """
+
+    def __init__(self, out_range='dtype', mode='running', alpha=0.1,
+                 per_channel=False, precision=np.float32):
+        if mode not in ('running', 'ema'):
+            raise ValueError("mode must be 'running' or 'ema'")
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be in the range (0, 1]')
+        self.out_range = out_range
+        self.mode = mode
+        self.alpha = alpha
+        self.per_channel = per_channel
+        self.precision = np.dtype(precision)
+        # The current input range (None until the first frame)
+        self.imin = None
+        self.imax = None
+
+    def update(self, frame):
+        """Update the input range with the intensities of `frame`."""
+        axes = (0, 1) if (self.per_channel and frame.ndim == 3) else None
+        fmin = np.min(frame, axis=axes, keepdims=True).astype(np.float64)
+        fmax = np.max(frame, axis=axes, keepdims=True).astype(np.float64)
+        if self.imin is None:
+            self.imin, self.imax = fmin, fmax
+        elif self.mode == 'running':
+            np.minimum(self.imin, fmin, out=self.imin)
+            np.maximum(self.imax, fmax, out=self.imax)
+        else:
+            self.imin += self.alpha * (fmin - self.imin)
+            self.imax += self.alpha * (fmax - self.imax)
+
+    def rescale(self, frame, out=None):
+        """Update the input range with `frame`, and return `frame` rescaled.
+        """
+        self.update(frame)
+        omin, omax = intensity_range(frame, self.out_range,
+                                     clip_negative=(self.imin.min() >= 0))
+        return _rescale_by_ranges(frame, self.imin, self.imax, omin, omax,
+                                  out, self.precision,
+                                  clip=(self.mode == 'ema'))
+
+
+def rescale_frames(frames, **kwargs):
+    """Rescale each frame of an iterable (for example, a generator) of
+    frames, yielding the rescaled frames one at a time.
+
+    Keyword arguments are passed to `StreamingRescaler`.
+    """
+    rescaler = StreamingRescaler(**kwargs)
+    for frame in frames:
+        yield rescaler.rescale(frame)
+
+
+@lru_cache(maxsize=64)
+def _bin_centers(imin, imax, nbins):
+    """Return the (read only) centers of `nbins` equal-width bins spanning
+    [imin, imax], as used by `HistogramSketch` with linear bins.
+    """
+    edges = np.linspace(imin, imax, nbins + 1)
+    centers = (edges[:-1] + edges[1:]) / 2
+    centers.setflags(write=False)
+    return centers
+
+
+def _sample(values, sample_size):
+    """Return about `sample_size` of `values`, evenly strided.
+
+    The stride is chosen to have no common factor with the length of the
+    last axis, so that the sample does not fall on only some of the columns
+    of an image.
+    """
+    step = values.size // sample_size
+    if step <= 1:
+        return values.reshape(-1)
+    width = values.shape[-1]
+    while np.gcd(step, width) != 1:
+        step += 1
+    return values.reshape(-1)[::step]
+
+
+def cumulative_distribution(image, nbins=256, sample_size=None, sketch=None):
+    """Return cumulative distribution function (cdf) for the given image.
+
+    Parameters
+    ----------
+    image : array
+        Image array.
+    nbins : int, optional
+        Number of bins for image histogram. Ignored for integer images, which
+        have a bin for each value between their min and max.
+    sample_size : int, optional
+        If given, the histogram of a floating point image is estimated from
+        about this many of its values, evenly spaced through the image.
+    sketch : HistogramSketch, optional
+        A sketch (with linear bins) of the image intensities to use instead of
+        the histogram of `image`. Sketches of the tiles of a large image made
+        with the same `value_range` can be merged, so that each tile can be
+        equalized with the distribution of the whole image.
+
+    Returns
+    -------
+    img_cdf : array
+        Values of cumulative distribution function.
+    bin_centers : array
+        Centers of bins.
+
+    See Also
+    --------
+    equalize_hist
+    """
+    if sketch is None:
+        image = np.asarray(image)
+        imin, imax = _image_min_max(image)
+        if image.dtype.kind in 'ui':
+            if (image.dtype.kind == 'u' and image.dtype.itemsize < 8 and
+                    imax < 2 ** 16):
+                # Unsigned values are already bin indices
+                hist = np.bincount(image.reshape(-1), minlength=int(imax) + 1)
+                hist = hist[int(imin):]
+            else:
+                hist = np.bincount(
+                    np.subtract(image.reshape(-1), imin, dtype=np.intp))
+            img_cdf = hist.cumsum() / float(image.size)
+            return img_cdf, np.arange(int(imin), int(imax) + 1)
+        values = image if sample_size is None else _sample(image, sample_size)
+        sketch = HistogramSketch(bins=nbins, value_range=(imin, imax))
+        sketch.add(values, (imin, imax))
+    elif sketch.log or sketch.counts is None:
+        raise ValueError('A nonempty sketch with linear bins is required')
+    img_cdf = sketch.counts.cumsum() / float(sketch.count)
+    return img_cdf, _bin_centers(*sketch.value_range, sketch.bins)
+
+
+def equalize_hist(image, nbins=256, mask=None, sample_size=2 ** 20,
+                  sketch=None):
+    """Return image after histogram equalization.
+
+    Parameters
+    ----------
+    image : array
+        Image array.
+    nbins : int, optional
+        Number of bins for image histogram. Note: this argument is
+        ignored for integer images, for which each integer is its own
+        bin.
+    mask : ndarray of bools or 0s and 1s, optional
+        Array of same shape as `image`. Only points at which mask == True
+        are used for the equalization, which is applied to the whole image.
+    sample_size : int or None, optional
+        The histogram of a floating point image with more values than this is
+        estimated from an evenly spaced sample of this many values. None uses
+        every value.
+    sketch : HistogramSketch, optional
+        A sketch (with linear bins) of the intensities to equalize with,
+        instead of those of `image` (see `cumulative_distribution`).
+
+    Returns
+    -------
+    out : float array
+        Image array after histogram equalization.
+
+    Notes
+    -----
+    This function is adapted from [1]_ with the author's permission. Integer
+    images are counted with `np.bincount`, and uint8 and uint16 images are
+    then mapped through a lookup table.
+
+    References
+    ----------
+    .. [1] http://www.janeriksolem.net/histogram-equalization-with-python-and.html
+    .. [2] https://en.wikipedia.org/wiki/Histogram_equalization
+
+    Examples
+    --------
+    Equalize each tile of a large image with the distribution of the whole
+    image, using `tiles` and `map_tiles` from imageutilssubset:
+
+    >>> from imageutilssubset import tiles, map_tiles
+    >>> image = np.random.default_rng(0).random((1024, 1024))
+    >>> value_range = (image.min(), image.max())
+    >>> sketch = HistogramSketch(256, value_range)
+    >>> for t in tiles(image, (512, 512)):
+    ...     sketch = sketch.merge(HistogramSketch(256, value_range).add(
+    ...         image[t.core]))
+    >>> out = map_tiles(lambda tile: equalize_hist(tile, sketch=sketch),
+    ...                 image, (512, 512))
+    """
+    image = np.asarray(image)
+    source = image if mask is None else image[np.asarray(mask, dtype=bool)]
+    img_cdf, bin_centers = cumulative_distribution(source, nbins, sample_size,
+                                                   sketch)
+    if sketch is None and image.dtype.kind in 'ui' and mask is None:
+        if _uses_lut(image):
+            # cdf[value - imin] for every value of the dtype
+            table = np.empty(np.iinfo(image.dtype).max + 1)
+            start, stop = int(bin_centers[0]), int(bin_centers[-1]) + 1
+            table[:start] = 0
+            table[start:stop] = img_cdf
+            table[stop:] = 1
+            return apply_lut(image, table)
+        return img_cdf[np.subtract(image, int(bin_centers[0]), dtype=np.intp)]
+    out = np.interp(image.reshape(-1), bin_centers, img_cdf)
+    return out.reshape(image.shape)
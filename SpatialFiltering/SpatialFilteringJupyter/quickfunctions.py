@@ -18,263 +18,1367 @@ tjn, 17 XI 2015, allow colorbar thickness adjustment in quick_show()
 tjn, 4 XII 2015, modified quick_correlate_images()
 tjn, 22 X 2020, updated to work on PythonAnywhere, including FONT_SIZE
 tjn, 26 XI 2020, fixed warning raised when subplot was passed non-integers
+tjn, 16 X 2026, quick_show() accepts a RolledView
+tjn, 16 X 2026, subplot figures shown and saved once, HEADLESS and
+    SAVEFIG_IN_BACKGROUND options, quick_flush()
+tjn, 16 X 2026, update argument to quick_show() and quick_plot() reuses the
+    image or line in a figure, savefig_suffix=False to skip saving
+tjn, 16 X 2026, FigureSession class holds the subplot state formerly in
+    module-level variables; quick_show() etc. use a default session
+tjn, 16 X 2026, TemplateMatcher class for batched FFT template matching
+tjn, 16 X 2026, find_peaks(); _highlight_correlations() marks one peak per
+    match
+tjn, 16 X 2026, quick_show() displays large images from a DecimationPyramid
+tjn, 16 X 2026, quick_render() maps an image through a colour map without a
+    figure
+tjn, 16 X 2026, quick_montage() lays out images (and labels) in one canvas
+tjn, 16 X 2026, quick_plot() draws long signals from min/max decimated
+    samples
 
 Tested with Python 3.7.3 on Jupyter Notebook 6.0.3.
 """
 
-from scipy import (array, ones, amax, count_nonzero, sqrt, ceil, isscalar, rint)
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from scipy import (array, ones, amax, sqrt, ceil, isscalar, rint, asarray,
+                   zeros, pad, stack, maximum, divide, finfo, flatnonzero,
+                   argpartition, argsort, unravel_index, column_stack, inf,
+                   log2, floor, empty, arange, concatenate, ascontiguousarray,
+                   iscomplexobj, isnan, log1p, nan, uint8, uint32, intp,
+                   float32, float64, searchsorted, linspace, logspace, log10,
+                   fmin, fmax, unique, nanmin, nanmax)
+from scipy.fft import rfft2, irfft2, next_fast_len
+from scipy.ndimage import maximum_filter, label
 
 # from skimage.exposure import rescale_intensity
-from skimage_exposure import rescale_intensity
-from skimage.morphology import binary_dilation, disk
+from skimage_exposure import rescale_intensity, intensity_range
+from skimage.morphology import disk
 from skimage.feature import match_template
+from PIL import Image, ImageDraw, ImageFont
 
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-from imageutilssubset import imread_sc
+from imageutilssubset import imread_sc, window_2d, RolledView, ArrayCache
 
 """
 
 Module-level variables
 
 """
-# Initialise plotting mode
-subplot_mode = False
-# Initialise subplot grid dimensions to invalid values of the correct type
-subplot_rows = 0
-subplot_cols = 0
-# Initialise subplot index to an invalid value of the correct type
-subplot_next_index = 0
 # Font size constants that can be overwritten by a caller
 FONT_SIZE = None
 SUP_FONT_SIZE = None
+# If True, figures are saved but plt.show() is never called (for example,
+# when generating figures in a script or on a server). Can be overwritten by
+# a caller.
+HEADLESS = False
+# If True, figures are saved to file by a background thread, so that the
+# caller can continue computing while a figure is encoded. Can be overwritten
+# by a caller.
+SAVEFIG_IN_BACKGROUND = False
 
 
 """
 
-Functions
+Classes
 
 """
 
 
-def quick_close():
-    """A wrapper for modules to close all figures without needing PyPlot as an
-    explicit dependency."""
-    plt.close('all')
+class FigureSession:
+    """The state of a sequence of quick_show() and quick_plot() calls: the
+    subplot mode and grid, the figure waiting to be shown and saved, figures
+    being saved in the background, and the images and lines that can be
+    updated in place.
 
-
-def quick_plot(x,
-               f,
-               format_str='b-',
-               title=None,
-               figure_handle=None,
-               style=None,
-               xlabel=None,
-               ylabel=None,
-               ylims=None,
-               xticklabels=None,
-               savefig_suffix=None):
-    """Plot a function f over horizontal axis values x.
-
-    Arguments:
-    x             : the values on the x-axis on which to plot each point.
-    f             : the values to plot.
-    format_str    : the plotted line format, passed unmodified to the plot
-                    command.
-    title         : title on plot.
-    figure_handle : a number representing the particular figure to overwrite.
-    style         : 'semilogy' for a logarithmically scaled y-axis, or
-                    anything else for a regular linearly scaled y-axis plot.
-    xlabel        : x-axis label.
-    ylabel        : y-axis label.
-    ylims         : if a scalar, then this becomes the lower y-axis limit. If
-                    a pair then is used for both lower and upper y-axis
-                    limits.
-    xticklabels   : a list of strings with which to replace the x-axis tick
-                    labels.
-    savefig_suffix: a suffix to append to the filename (before the dot).
-    """
-    if figure_handle is not None:
-        # Distinguish between None and 0.
-        plt.figure(figure_handle)
-        # Clear the plot in the existing figure (if any)
-        plt.clf()
-    else:
-        # Create a new figure
-        plt.figure()
-    if style == 'semilogy':
-        plt.semilogy(x, f, format_str)
-    elif style == 'semilogx':
-        plt.semilogx(x, f, format_str)
-    else:
-        plt.plot(x, f, format_str)
-    plt.axis('tight')
-    if title:
-        plt.title(title)
-    if xlabel:
-        plt.xlabel(xlabel)
-    if ylabel:
-        plt.ylabel(ylabel)
-    # If ylims is a scalar/tuple/list then use its values appropriately.
-    # Otherwise, ensure that the vertical axis has some decent range so that a
-    # signal composed of purely rounding errors is not plotted in 'tight' mode.
-    if isscalar(ylims):
-        # Apply as lower limit only
-        plt.ylim(ylims, plt.ylim()[1])
-    elif isinstance(ylims, (list, tuple)) and (len(ylims) == 2):
-        # Apply as both lower and upper limits
-        plt.ylim(ylims)
-    elif (plt.ylim()[1] - plt.ylim()[0]) < 0.5:
-        plt.ylim((-1, 1))
-    else:
-        # Do nothing and let 'tight' mode decide
-        pass
-    if xticklabels:
-        plt.locator_params(axis='x', nbins=len(xticklabels))
-        axes = plt.gca()
-        # print(axes.get_xticks().tolist())
-        axes.set_xticklabels(xticklabels)
-    plt.show()
-    if savefig_suffix is None:
-        savefig_suffix = ''
-    plt.savefig(f'graph{savefig_suffix}.png')
-
-
-def quick_show(im,
-               title=None,
-               cmap=None,
-               colorbar=False,
-               subplot=None,
-               newsubplotfig=False,
-               figure_handle=None,
-               fontsize=None,
-               suptitle=None,
-               supfontsize=None,
-               normalise=True,
-               axis_off=True,
-               tight=False,
-               savefig_suffix=None,
-               **keywords):
-    """Wrapping up boilerplate code to display an image.
-
-    Plots will not be displayed in subplot mode by default.
-    If a subplot is required, the subplot grid (height, width) arguments
-    should be passed as a 2-tuple through argument "subplot". From then on,
-    all plots will be in subplot mode, until the subplot matrix has filled, in
-    which case, subplot mode will end.
-    If the user wishes to change away from subplot mode before the subplot
-    matrix has filled, they need to pass the parameter subplot=False.
-    Additional keyword arguments in the dict **keywords are passed blindly
-    to plt.imshow().
+    The module-level functions quick_show(), quick_plot(), quick_flush(), and
+    quick_close() use a default session. Other sessions can be created so
+    that several sequences of figures can be built independently, for
+    example on different threads.
 
     Arguments
     ---------
-    colorbar : bool or string
-        True if a colorbar is to be displayed with the plot or subplot, False
-        otherwise.
-        If a string, then represents a proportion of the plot to use for the
-        colorbar, e.g. '10%' or any other value supported by the 'size'
-        parameter to append_axes().
+    pyplot : bool
+        If True, figures are created and shown with PyPlot, as the
+        module-level functions do. If False, figures are created as
+        matplotlib Figure objects that PyPlot does not know about, so they
+        are never shown (only saved). PyPlot is not thread-safe, so sessions
+        used on threads other than the main thread should pass False.
+    prefix : string
+        Figures are saved to {prefix}{savefig_suffix}.png.
+    headless, savefig_in_background : bool or None
+        Override the module-level HEADLESS and SAVEFIG_IN_BACKGROUND for
+        this session, unless None.
     """
-    global subplot_mode, subplot_rows, subplot_cols, subplot_next_index
 
-    def _set_figure(figure_handle, newfig=True):
-        """Local function.
-        Set the specified figure as active, if appropriate.
+    def __init__(self, pyplot=True, prefix='graph', headless=None,
+                 savefig_in_background=None):
+        self.pyplot = pyplot
+        self.prefix = prefix
+        self.headless = headless
+        self.savefig_in_background = savefig_in_background
+        # Initialise plotting mode
+        self.subplot_mode = False
+        # Initialise subplot grid dimensions to invalid values of the correct
+        # type
+        self.subplot_rows = 0
+        self.subplot_cols = 0
+        # Initialise subplot index to an invalid value of the correct type
+        self.subplot_next_index = 0
+        # The current figure, and the figures created by this session (keyed
+        # by figure handle where one was given)
+        self._figure = None
+        self._figures = {}
+        self._unnumbered_figures = []
+        # A subplot figure is shown and saved once, when its subplot grid has
+        # filled (or when another figure is started, or on flush()), rather
+        # than after each subplot. Until then, it and its filename suffix are
+        # pending here.
+        self._pending_figure = None
+        self._pending_suffix = ''
+        # Background saving of figures
+        self._savefig_pool = None
+        self._savefig_futures = []
+        # The image or line drawn by show() or plot() in each numbered
+        # figure (keyed by figure handle), so that it can be updated in place
+        self._artists = {}
+
+    def _is_headless(self):
+        """Return True if figures are never shown by this session."""
+        if not self.pyplot:
+            return True
+        return HEADLESS if self.headless is None else self.headless
+
+    def close(self):
+        """Show and save any pending subplot figure, wait for figures being
+        saved in the background, and close the figures of this session.
+        """
+        self.flush(wait=True)
+        self._artists.clear()
+        if self.pyplot:
+            for figure in (list(self._figures.values()) +
+                           self._unnumbered_figures):
+                plt.close(figure)
+        self._figures.clear()
+        self._unnumbered_figures.clear()
+        self._figure = None
+
+    def flush(self, wait=False):
+        """Show and save the pending subplot figure (if any) now, rather than
+        when its subplot grid fills.
+
+        If wait is True, also wait for figures being saved in the background
+        to be written, raising any exception raised while saving one.
+        """
+        if self._pending_figure is not None:
+            figure, self._pending_figure = self._pending_figure, None
+            self._show_and_save(figure, self._pending_suffix)
+        if wait:
+            while self._savefig_futures:
+                self._savefig_futures.pop(0).result()
+
+    def _show_and_save(self, figure, savefig_suffix=None, show=True):
+        """Show 'figure' (if show is True, unless headless) and save it to
+        {prefix}{savefig_suffix}.png, in the background if
+        savefig_in_background. The figure is not saved if savefig_suffix is
+        False.
+        """
+        if show and not self._is_headless():
+            plt.show()
+        if savefig_suffix is False:
+            return
+        if savefig_suffix is None:
+            savefig_suffix = ''
+        fname = f'{self.prefix}{savefig_suffix}.png'
+        background = self.savefig_in_background
+        if background is None:
+            background = SAVEFIG_IN_BACKGROUND
+        if not background:
+            figure.savefig(fname)
+            return
+        # One thread, so that figures saved to the same file are written in
+        # order
+        if self._savefig_pool is None:
+            self._savefig_pool = ThreadPoolExecutor(max_workers=1)
+        # Forget figures already saved, raising any exception from saving them
+        futures = self._savefig_futures
+        while futures and futures[0].done():
+            futures.pop(0).result()
+        futures.append(self._savefig_pool.submit(figure.savefig, fname))
+
+    def _set_figure(self, figure_handle, newfig=True):
+        """Set the specified figure as active, if appropriate.
         Distinguish between a figure handle of 0 and None.
         Create a new figure, if appropriate.
+        Return the active figure.
         """
+        if figure_handle is not None or newfig:
+            # Finish any pending subplot figure before starting another
+            self.flush()
         if figure_handle is not None:
-            plt.figure(figure_handle)
+            if self.pyplot:
+                figure = plt.figure(figure_handle)
+            else:
+                figure = self._figures.get(figure_handle) or Figure()
+            self._figures[figure_handle] = figure
             # Clear the plot in the existing figure (if any)
-            plt.clf()
+            figure.clf()
         elif newfig:
             # Create a new figure
-            plt.figure()
+            figure = plt.figure() if self.pyplot else Figure()
+            self._unnumbered_figures.append(figure)
+        elif self.pyplot:
+            figure = plt.gcf()
+        else:
+            figure = self._figure or self._set_figure(None)
+        self._figure = figure
+        return figure
+
+    def _figure_exists(self, figure_handle):
+        """Return True if this session has an open figure 'figure_handle'."""
+        if self.pyplot:
+            return plt.fignum_exists(figure_handle)
+        return figure_handle in self._figures
+
+    def _reusable_artist(self, figure_handle, kind):
+        """Return the record of the artist drawn in figure 'figure_handle' by
+        a previous call of the same kind (and with the same options), or None.
+        """
+        if figure_handle is None or not self._figure_exists(figure_handle):
+            return None
+        entry = self._artists.get(figure_handle)
+        if entry is None or entry['kind'] != kind:
+            return None
+        return entry
+
+    def _remember_artist(self, figure_handle, kind, artist, view=None):
+        """Record the artist drawn in figure 'figure_handle' (and the
+        _PyramidView or _DecimatedLine that chooses its values, if any), for
+        updates.
+        """
+        if figure_handle is not None:
+            self._artists[figure_handle] = {'kind': kind,
+                                            'artist': artist,
+                                            'view': view,
+                                            'background': None}
+
+    def _redraw(self, entry, full):
+        """Redraw the figure containing an updated artist.
+
+        If nothing but the artist's data has changed (full is False) and the
+        backend supports blitting, only the artist is drawn over a cached copy
+        of the rest of its axes. Otherwise the whole figure is drawn, and the
+        copy is refreshed.
+        """
+        if self._is_headless():
+            # Saving the figure will draw it
+            return
+        artist = entry['artist']
+        axes = artist.axes
+        canvas = axes.figure.canvas
+        if not canvas.supports_blit:
+            canvas.draw_idle()
+        elif full or entry['background'] is None:
+            # Draw everything but the artist, keep a copy, then add the artist
+            artist.set_animated(True)
+            canvas.draw()
+            entry['background'] = canvas.copy_from_bbox(axes.bbox)
+            artist.set_animated(False)
+            axes.draw_artist(artist)
+            canvas.blit(axes.bbox)
+        else:
+            canvas.restore_region(entry['background'])
+            axes.draw_artist(artist)
+            canvas.blit(axes.bbox)
+        canvas.flush_events()
+
+    def plot(self,
+             x,
+             f,
+             format_str='b-',
+             title=None,
+             figure_handle=None,
+             style=None,
+             xlabel=None,
+             ylabel=None,
+             ylims=None,
+             xticklabels=None,
+             savefig_suffix=None,
+             update=False,
+             decimate=True):
+        """Plot a function f over horizontal axis values x.
+
+        Arguments:
+        x             : the values on the x-axis on which to plot each point.
+        f             : the values to plot.
+        format_str    : the plotted line format, passed unmodified to the plot
+                        command.
+        title         : title on plot.
+        figure_handle : a number representing the particular figure to
+                        overwrite.
+        style         : 'semilogy' for a logarithmically scaled y-axis, or
+                        anything else for a regular linearly scaled y-axis
+                        plot.
+        xlabel        : x-axis label.
+        ylabel        : y-axis label.
+        ylims         : if a scalar, then this becomes the lower y-axis limit.
+                        If a pair then is used for both lower and upper y-axis
+                        limits.
+        xticklabels   : a list of strings with which to replace the x-axis
+                        tick labels.
+        savefig_suffix: a suffix to append to the filename (before the dot),
+                        or False to not save the figure.
+        update        : if True, and figure figure_handle already contains a
+                        plot made by plot() with the same format_str, style,
+                        and xticklabels, replace the values of its line
+                        rather than clearing the figure and plotting again.
+                        This is much faster when plotting repeatedly, for
+                        example during a parameter sweep. The figure is
+                        redrawn (by blitting, if possible) but plt.show() is
+                        not called again.
+        decimate      : if True, and f is a 1D signal with many more samples
+                        than the axes has pixel columns (with x increasing),
+                        plot only the first, minimum, maximum, and last
+                        sample in each column, which draws the same shape
+                        (including peaks and aliasing) as every sample does.
+                        The samples are chosen again when the axes are
+                        zoomed. Markers in format_str are drawn at the chosen
+                        samples only.
+        """
+        # Finish any pending subplot figure before starting this one
+        self.flush()
+        kind = ('plot', format_str, style,
+                tuple(xticklabels) if xticklabels else None)
+        entry = self._reusable_artist(figure_handle, kind) if update else None
+        if entry is not None:
+            line = entry['artist']
+            axes = line.axes
+            before = (axes.get_xlim(), axes.get_ylim(), axes.get_title())
+            if entry['view']:
+                entry['view'].set_data(x, f)
+            else:
+                line.set_data(x, f)
+            # As plt.axis('tight') does
+            axes.set_autoscale_on(True)
+            axes.relim()
+            axes.autoscale_view(tight=True)
+            if title:
+                axes.set_title(title)
+            _apply_ylims(axes, ylims)
+            full = (before !=
+                    (axes.get_xlim(), axes.get_ylim(), axes.get_title()))
+            self._redraw(entry, full)
+            self._show_and_save(axes.figure, savefig_suffix, show=False)
+            return
+        figure = self._set_figure(figure_handle)
+        axes = figure.gca()
+        # As semilogy() and semilogx() do
+        if style == 'semilogy':
+            axes.set_yscale('log')
+        elif style == 'semilogx':
+            axes.set_xscale('log')
+        view = None
+        if decimate and _DecimatedLine.suits(axes, x, f):
+            view = _DecimatedLine(axes, asarray(x), asarray(f), format_str)
+            line = view.line
+        else:
+            line = axes.plot(x, f, format_str)[0]
+        self._remember_artist(figure_handle, kind, line, view)
+        axes.axis('tight')
+        if title:
+            axes.set_title(title)
+        if xlabel:
+            axes.set_xlabel(xlabel)
+        if ylabel:
+            axes.set_ylabel(ylabel)
+        _apply_ylims(axes, ylims)
+        if xticklabels:
+            axes.locator_params(axis='x', nbins=len(xticklabels))
+            # print(axes.get_xticks().tolist())
+            axes.set_xticklabels(xticklabels)
+        self._show_and_save(figure, savefig_suffix)
+
+    def show(self,
+             im,
+             title=None,
+             cmap=None,
+             colorbar=False,
+             subplot=None,
+             newsubplotfig=False,
+             figure_handle=None,
+             fontsize=None,
+             suptitle=None,
+             supfontsize=None,
+             normalise=True,
+             axis_off=True,
+             tight=False,
+             savefig_suffix=None,
+             update=False,
+             decimate=True,
+             **keywords):
+        """Wrapping up boilerplate code to display an image.
+
+        Plots will not be displayed in subplot mode by default.
+        If a subplot is required, the subplot grid (height, width) arguments
+        should be passed as a 2-tuple through argument "subplot". From then
+        on, all plots will be in subplot mode, until the subplot matrix has
+        filled, in which case, subplot mode will end.
+        If the user wishes to change away from subplot mode before the subplot
+        matrix has filled, they need to pass the parameter subplot=False.
+        A figure of subplots is shown and saved once, when the subplot matrix
+        has filled, when another figure is started, or when flush() or close()
+        is called.
+        Additional keyword arguments in the dict **keywords are passed blindly
+        to imshow().
+
+        Arguments
+        ---------
+        colorbar : bool or string
+            True if a colorbar is to be displayed with the plot or subplot,
+            False otherwise.
+            If a string, then represents a proportion of the plot to use for
+            the colorbar, e.g. '10%' or any other value supported by the
+            'size' parameter to append_axes().
+        savefig_suffix : string or False
+            A suffix to append to the filename (before the dot), or False to
+            not save the figure.
+        update : bool
+            If True, and figure figure_handle already contains an image shown
+            by show() (outside subplot mode, and without a suptitle) with the
+            same colorbar, axis_off, tight, and keyword arguments, replace the
+            values of that image rather than clearing the figure and showing
+            it again. This is much faster when showing images repeatedly, for
+            example in an animation. The figure is redrawn (by blitting, if
+            possible) but plt.show() is not called again.
+        decimate : bool
+            If True, an image with more pixels than its axes has on screen
+            (or in the saved figure, if that has a higher dpi) is shown from
+            a DecimationPyramid, at the level that matches the size of the
+            axes, so that drawing does not depend on the size of the image.
+            When the axes are zoomed, a finer level (up to the full image) is
+            shown. Ignored if an 'extent', 'origin', or 'norm' keyword
+            argument is passed.
+        """
+        def _colorbar_right(size):
+            """Local function.
+            Create a colorbar to the right of the current axis that is the
+            same size as that axis.
+            """
+            # Create divider for existing axes instance
+            divider = make_axes_locatable(axes)
+            # Append a new axis to the right of this axis, where 'size'
+            # represents a proportion of its width, for example.
+            cax = divider.append_axes('right', size=size, pad=0.05)
+            # Create colorbar in the appended axes
+            figure.colorbar(image, cax=cax)
+
+        """
+        Function begins here.
+        """
+        # Allow font size to be determined by a caller that injects a value
+        # into these module-level constants.
+        if fontsize is None:
+            fontsize = FONT_SIZE
+        if supfontsize is None:
+            supfontsize = SUP_FONT_SIZE
+        kind = ('image', colorbar, axis_off, tight,
+                tuple(sorted((k, repr(v)) for k, v in keywords.items()
+                             if k not in ('vmin', 'vmax'))))
+        entry = None
+        if (update and im is not None and not suptitle and not subplot and
+                not self.subplot_mode):
+            entry = self._reusable_artist(figure_handle, kind)
+        if entry is not None:
+            full = _update_image(entry, _prepare_image(im, normalise), title,
+                                 _resolve_cmap(cmap), fontsize, keywords)
+            self._redraw(entry, full)
+            self._show_and_save(entry['artist'].figure, savefig_suffix,
+                                show=False)
+            return
+        if subplot:
+            if newsubplotfig:
+                # Create a new figure
+                figure = self._set_figure(figure_handle)
+                # Reset the subplot index counter
+                self.subplot_next_index = 1
+            else:
+                # Make the appropriate figure active, if specified. Note, the
+                # user will have implicitly set newsubplotfig=False.
+                # The user will have to be careful here, because the session
+                # variables controlling the subplot matrix shape, and the next
+                # subplot index, are re-used for each plot.
+                figure = self._set_figure(figure_handle, newfig=False)
+                # The subplot layout may have changed in the middle of adding
+                # subplots to a figure. Check if layout requires smaller
+                # subplots than before, and if so, leave some space (by
+                # incrementing the subplot index counter) so that previous
+                # subplots are not overwritten.
+                if self.subplot_rows < subplot[0]:
+                    # Skip the next subplot row
+                    self.subplot_next_index += subplot[1]
+                elif self.subplot_cols < subplot[1]:
+                    # Skip the next subplot column
+                    self.subplot_next_index += 1
+            # Store these values in session variables so they are persistent
+            # between function calls.
+            self.subplot_rows, self.subplot_cols = subplot
+            self.subplot_mode = True
+        elif not self.subplot_mode:
+            # User is not in subplot mode, so create a new figure for each new
+            # plot.
+            figure = self._set_figure(figure_handle)
+        elif subplot is False:
+            # User was in subplot mode but now wants to change. Note, this
+            # False value is intentionally distinct from None.
+            self.subplot_mode = False
+            figure = self._set_figure(figure_handle)
+        elif (self.subplot_next_index >
+              (self.subplot_rows * self.subplot_cols)):
+            # The user was previously in subplot mode, but the subplot matrix
+            # is already filled. The user has not specified a new subplot
+            # shape so just end subplot mode.
+            subplot = False
+            self.subplot_mode = False
+            figure = self._set_figure(figure_handle)
+        else:
+            # The user is in normal subplot mode, and has not specified a
+            # subplot matrix shape, so re-use the shape from the session
+            # variables.
+            if newsubplotfig:
+                # Create a new figure
+                figure = self._set_figure(figure_handle)
+                # Reset the subplot index counter
+                self.subplot_next_index = 1
+            else:
+                # Make the appropriate figure active, if specified. Note, the
+                # user will have implicitly set newsubplotfig=False.
+                # The user will have to be careful here, because the session
+                # variables controlling the subplot matrix shape, and the next
+                # subplot index, are re-used for each plot.
+                figure = self._set_figure(figure_handle, newfig=False)
+
+        cmap = _resolve_cmap(cmap)
+        axes = None
+        if self.subplot_mode:
+            try:
+                if self.pyplot:
+                    axes = plt.subplot(self.subplot_rows, self.subplot_cols,
+                                       self.subplot_next_index)
+                else:
+                    axes = figure.add_subplot(self.subplot_rows,
+                                              self.subplot_cols,
+                                              self.subplot_next_index)
+            except ValueError as e:
+                # Print an error message but continue (potentially populating
+                # the remainder of the subplot grid).
+                print('Error specifying an index for the subplot. Message '
+                      'is: ' + str(e))
+            else:
+                self.subplot_next_index += 1
+        if axes is None:
+            axes = figure.gca()
+        if im is None:
+            # Make a blank subplot location. Only intended for sub-plot mode.
+            pass
+            # Hide axis tick labels
+            axes.axis('off')
+        else:
+            im = _prepare_image(im, normalise)
+            # Show the image, passing the cmap, and any additional keyword
+            # arguments from dict 'keywords'.
+            view = None
+            if decimate and not any(k in keywords for k in
+                                    ('extent', 'origin', 'norm')):
+                view = _PyramidView(axes, DecimationPyramid(im), cmap=cmap,
+                                    **keywords)
+                image = view.image
+            else:
+                image = axes.imshow(im, cmap=cmap, **keywords)
+            if not self.subplot_mode:
+                self._remember_artist(figure_handle, kind, image, view)
+            # Optional titles for figure/subplot
+            if title:
+                if fontsize:
+                    axes.set_title(title, fontsize=fontsize)
+                else:
+                    axes.set_title(title)
+            if suptitle:
+                if supfontsize:
+                    figure.suptitle(suptitle, fontsize=supfontsize)
+                elif fontsize:
+                    supfontsize = rint(int(fontsize) * 1.5)
+                    figure.suptitle(suptitle, fontsize=supfontsize)
+                else:
+                    figure.suptitle(suptitle)
+            # Hide axis tick labels, by default
+            if axis_off:
+                axes.axis('off')
+            # Optional tight layout
+            if tight:
+                figure.tight_layout()
+            # Optional colour bar. This has to go at the bottom, because it
+            # creates a new axis object, and subsequent calls to
+            # plt.axis('off'), for example, would turn of the ticks on the
+            # colour bar rather than on the intended axis.
+            if colorbar:
+                # If colorbar is a string, then it either refers to a preset
+                # colorbar configuration, or else it refers to a string
+                # appropriate for the 'size' parameter to append_axes().
+                # If colorbar is a float, it refers to the fraction parameter
+                # to colorbar().
+                if isinstance(colorbar, float):
+                    # A factor to rescale the colorbar (for example to stop
+                    # the colorbar overlapping with the title text).
+                    figure.colorbar(image, ax=axes, fraction=colorbar)
+                elif colorbar == 'small':
+                    # A factor that stops the colorbar from overlapping with
+                    # the title text on my particular screen.
+                    figure.colorbar(image, ax=axes, fraction=0.04)
+                elif colorbar == 'thin':
+                    # A percentage that looks good on my particular screen, so
+                    # that suplots are as large as possible.
+                    _colorbar_right('2%')
+                elif isinstance(colorbar, str):
+                    # Some other percentage string (possibly above percentage
+                    # is too thin).
+                    _colorbar_right(colorbar)
+                else:
+                    # If it is simply a bool, or anything else, display the
+                    # standard colorbar.
+                    figure.colorbar(image, ax=axes)
+            if not self.subplot_mode:
+                self._show_and_save(figure, savefig_suffix)
+                return
+            self._pending_figure = figure
+            self._pending_suffix = savefig_suffix
+        # Show and save a figure of subplots once its subplot matrix has
+        # filled
+        if (self.subplot_mode and self.subplot_next_index >
+                (self.subplot_rows * self.subplot_cols)):
+            self.flush()
+
+
+class TemplateMatcher:
+    """Normalised cross-correlation of images with a library of templates,
+    computed in the Fourier domain.
+
+    The results are the same (to within floating point rounding) as those of
+    skimage.feature.match_template(image, template, pad_input=pad_input),
+    but the conjugate spectrum of each template is computed once for each
+    padded image size and cached, and several correlations are computed with
+    one batched inverse FFT:
+        match(image)        correlates one image with every template, and
+        match_stack(images) correlates a stack of images with one template.
+    match_frames() correlates the frames from an iterable (for example, a
+    generator reading frames from a video) with one template, in batches.
+
+    Arguments
+    ---------
+    templates : a 2-D array, or a sequence of 2-D arrays (which may have
+        different shapes).
+    pad_input : as for match_template(). If True, each result has the shape
+        of the image, and its peaks are at the centres of the matches.
+    cache_bytes : the maximum total size of the cached template spectra.
+    workers : the number of threads for each FFT (see scipy.fft).
+    """
+
+    def __init__(self, templates, pad_input=True, cache_bytes=2 ** 28,
+                 workers=None):
+        if getattr(templates, 'ndim', None) == 2:
+            templates = [templates]
+        self.templates = [asarray(t, dtype=float) for t in templates]
+        self.pad_input = pad_input
+        self.workers = workers
+        # The padding applied to every image: enough for the largest template
+        self._margin = tuple(max(t.shape[i] for t in self.templates)
+                             for i in (0, 1))
+        self._means = [t.mean() for t in self.templates]
+        self._ssds = [((t - m) ** 2).sum()
+                      for t, m in zip(self.templates, self._means)]
+        self._spectra = ArrayCache(cache_bytes)
+
+    def cache_info(self):
+        """Return statistics of the cache of template spectra."""
+        return self._spectra.info()
+
+    def _template_spectra(self, fft_shape, indices):
+        """Return the conjugate spectra of templates 'indices', zero padded
+        to 'fft_shape', stacked along the first axis.
+        """
+        def _make():
+            return stack([rfft2(self.templates[i], fft_shape,
+                                workers=self.workers).conj()
+                          for i in indices])
+        return self._spectra.get((fft_shape, tuple(indices)), _make)
+
+    def _pad(self, images):
+        """Zero pad the last two axes of 'images' by the margin, and return
+        the padded images and the FFT shape to use for them.
+        """
+        m0, m1 = self._margin
+        padding = [(0, 0)] * (images.ndim - 2) + [(m0, m0), (m1, m1)]
+        padded = pad(asarray(images, dtype=float), padding, mode='constant')
+        fft_shape = tuple(next_fast_len(n, real=True)
+                          for n in padded.shape[-2:])
+        return padded, fft_shape
+
+    def _normalise(self, index, padded, padded2, xcorr, image_shape,
+                   sums=None):
+        """Normalise the cross-correlation 'xcorr' of the (stack of) padded
+        images with template 'index', as match_template() does.
+
+        The window sums of the images depend only on the shape of the
+        template, so if a dict 'sums' is passed, they are kept in it for
+        templates of the same shape.
+        """
+        template = self.templates[index]
+        t0, t1 = template.shape
+        # The padding that match_template() would use for this template lies
+        # inside the padding for the largest template.
+        o0, o1 = self._margin[0] - t0, self._margin[1] - t1
+        n0, n1 = image_shape[0] + 2 * t0, image_shape[1] + 2 * t1
+        window = (Ellipsis, slice(o0, o0 + n0), slice(o1, o1 + n1))
+        if sums is None or template.shape not in sums:
+            window_sums = (_window_sum(padded[window], template.shape),
+                           _window_sum(padded2[window], template.shape))
+            if sums is not None:
+                sums[template.shape] = window_sums
+        else:
+            window_sums = sums[template.shape]
+        window_sum, window_sum2 = window_sums
+        # The part of the (trimmed) correlation plane that is returned
+        if self.pad_input:
+            d0, d1 = (t0 - 1) // 2, (t1 - 1) // 2
+            r0, r1 = image_shape
+        else:
+            d0, d1 = t0 - 1, t1 - 1
+            r0, r1 = image_shape[0] - t0 + 1, image_shape[1] - t1 + 1
+        region = (Ellipsis, slice(d0, d0 + r0), slice(d1, d1 + r1))
+        window_sum = window_sum[region]
+        window_sum2 = window_sum2[region]
+        # Trimmed by one sample on each side, as in match_template()
+        xcorr = xcorr[..., o0 + 1 + d0:o0 + 1 + d0 + r0,
+                      o1 + 1 + d1:o1 + 1 + d1 + r1]
+
+        numerator = xcorr - window_sum * self._means[index]
+        denominator = window_sum2 - window_sum * window_sum / (t0 * t1)
+        denominator *= self._ssds[index]
+        # sqrt of negative number not allowed
+        maximum(denominator, 0, out=denominator)
+        sqrt(denominator, out=denominator)
+        response = zeros(numerator.shape)
+        # Avoid division by zero
+        divide(numerator, denominator, out=response,
+               where=denominator > finfo(float).eps)
+        return response
+
+    def match(self, image):
+        """Return a list of the correlations of 'image' with each template.
+        """
+        padded, fft_shape = self._pad(image)
+        spectra = self._template_spectra(fft_shape,
+                                         range(len(self.templates)))
+        xcorr = irfft2(rfft2(padded, fft_shape, workers=self.workers) *
+                       spectra, fft_shape, workers=self.workers)
+        padded2 = padded ** 2
+        sums = {}
+        return [self._normalise(i, padded, padded2, xcorr[i], image.shape,
+                                sums)
+                for i in range(len(self.templates))]
+
+    def match_stack(self, images, template=0):
+        """Return the correlations of each image of a stack (a 3-D array, or
+        a sequence of images of the same shape) with template number
+        'template', as a 3-D array.
+        """
+        images = asarray(images, dtype=float)
+        padded, fft_shape = self._pad(images)
+        spectrum = self._template_spectra(fft_shape, (template,))[0]
+        xcorr = irfft2(rfft2(padded, fft_shape, workers=self.workers) *
+                       spectrum, fft_shape, workers=self.workers)
+        return self._normalise(template, padded, padded ** 2, xcorr,
+                               images.shape[1:])
 
-    def _colorbar_right(size):
-        """Local function.
-        Create a colorbar to the right of the current axis that is the same
-        size as that axis.
+    def match_frames(self, frames, template=0, batch_size=16):
+        """Correlate each frame from the iterable 'frames' with template
+        number 'template', yielding the correlations one at a time. Frames
+        are correlated in batches of 'batch_size' with match_stack().
         """
-        # Create divider for existing axes instance
-        divider = make_axes_locatable(plt.gca())
-        # Append a new axis to the right of this axis, where 'size'
-        # represents a proportion of its width, for example.
-        cax = divider.append_axes('right', size=size, pad=0.05)
-        # Create colorbar in the appended axes
-        plt.colorbar(cax=cax)
+        batch = []
+        for frame in frames:
+            batch.append(frame)
+            if len(batch) == batch_size:
+                yield from self.match_stack(batch, template)
+                batch = []
+        if batch:
+            yield from self.match_stack(batch, template)
 
+
+class DecimationPyramid:
+    """Successively halved copies of an image, for display at less than its
+    full resolution.
+
+    Level 0 is the image itself, and each further level is made (when first
+    needed) by averaging 2x2 blocks of the level before, which avoids the
+    aliasing of simply taking every other pixel. An image with an odd number
+    of rows or columns is first extended by repeating its last row or column.
+    Integer images keep their dtype.
     """
-    Function begins here.
+
+    def __init__(self, im):
+        self.levels = [asarray(im)]
+
+    @property
+    def shape(self):
+        return self.levels[0].shape
+
+    def level(self, k):
+        """Return level k, making it (and any levels before it) if needed."""
+        while len(self.levels) <= k:
+            a = self.levels[-1]
+            rows, cols = a.shape[0], a.shape[1]
+            if rows % 2 or cols % 2:
+                padding = ([(0, rows % 2), (0, cols % 2)] +
+                           [(0, 0)] * (a.ndim - 2))
+                a = pad(a, padding, mode='edge')
+            half = a.reshape(a.shape[0] // 2, 2, a.shape[1] // 2, 2,
+                             *a.shape[2:]).mean(axis=(1, 3))
+            if a.dtype.kind in 'uib':
+                half = rint(half).astype(a.dtype)
+            self.levels.append(half)
+        return self.levels[k]
+
+    def level_for(self, rows, cols):
+        """Return the coarsest level that still has at least 'rows' x 'cols'
+        pixels (0, if the image itself has fewer).
+        """
+        if rows <= 0 or cols <= 0:
+            return 0
+        ratio = min(self.shape[0] / rows, self.shape[1] / cols)
+        return int(floor(log2(ratio))) if ratio >= 2 else 0
+
+    def extent(self, k):
+        """Return the extent (as for imshow()) of level k, in the pixel
+        coordinates of the full image.
+        """
+        scale = 2 ** k
+        rows, cols = self.level(k).shape[:2]
+        return (-0.5, cols * scale - 0.5, rows * scale - 0.5, -0.5)
+
+
+class _PyramidView:
+    """Show the level of a DecimationPyramid that matches the number of
+    pixels that 'axes' has for the visible part of the image, and show
+    another level when the axes are zoomed or resized.
     """
-    # Allow font size to be determined by a caller that injects a value into
-    # these module-level constants.
-    if fontsize is None:
-        fontsize = FONT_SIZE
-    if supfontsize is None:
-        supfontsize = SUP_FONT_SIZE
-    if subplot:
-        if newsubplotfig:
-            # Create a new figure
-            _set_figure(figure_handle)
-            # Reset the subplot index counter
-            subplot_next_index = 1
+
+    def __init__(self, axes, pyramid, **keywords):
+        self.axes = axes
+        self.pyramid = pyramid
+        im = pyramid.levels[0]
+        if im.ndim == 2 and not ('vmin' in keywords and 'vmax' in keywords):
+            # Scale colours to the full image, not to the averaged level.
+            # Ignore NaN values, as imshow() does.
+            keywords.setdefault('vmin', nanmin(im))
+            keywords.setdefault('vmax', nanmax(im))
+        self.level = 0
+        self.image = axes.imshow(pyramid.level(0), extent=pyramid.extent(0),
+                                 **keywords)
+        # The level can only be chosen once the limits show the whole image
+        self._set_limits()
+        self.refresh()
+        axes.callbacks.connect('xlim_changed', lambda ax: self.refresh())
+        axes.callbacks.connect('ylim_changed', lambda ax: self.refresh())
+
+    def _best_level(self):
+        """Return the level with about as many pixels as the axes has for
+        the visible part of the image (allowing for a higher savefig dpi).
+        """
+        height, width = _axes_pixels(self.axes)
+        x0, x1 = self.axes.get_xlim()
+        y0, y1 = self.axes.get_ylim()
+        # Axes pixels needed for the whole image at the current zoom
+        rows = height * self.pyramid.shape[0] / abs(y1 - y0)
+        cols = width * self.pyramid.shape[1] / abs(x1 - x0)
+        return self.pyramid.level_for(rows, cols)
+
+    def _set_limits(self):
+        """Show the whole image, but not the rows and columns added to
+        odd-sized levels.
+        """
+        rows, cols = self.pyramid.shape[:2]
+        self.axes.set_xlim(-0.5, cols - 0.5)
+        self.axes.set_ylim(rows - 0.5, -0.5)
+
+    def set_pyramid(self, pyramid):
+        """Show (a level of) another pyramid."""
+        reshaped = pyramid.shape[:2] != self.pyramid.shape[:2]
+        self.pyramid = pyramid
+        self.level = None
+        if reshaped:
+            self._set_limits()
+        self.refresh()
+
+    def refresh(self):
+        """Show the best level, if it is not the one already shown."""
+        level = self._best_level()
+        if level != self.level:
+            self.level = level
+            self.image.set_data(self.pyramid.level(level))
+            self.image.set_extent(self.pyramid.extent(level))
+
+
+class _DecimatedLine:
+    """Plot a long signal f(x) (with x increasing) as a line through the
+    first, minimum, maximum, and last samples in each pixel column of the
+    visible part of 'axes', and choose the samples again when the axes are
+    zoomed.
+
+    Within a column, the line covers the range between the minimum and the
+    maximum, and it joins each column to the next through the same pair of
+    samples as a line through every sample, so it draws the same pixels.
+    """
+
+    def __init__(self, axes, x, f, format_str):
+        self.axes = axes
+        self.x = x
+        self.f = f
+        self.line = axes.plot(*self._samples(full=True), format_str)[0]
+        axes.callbacks.connect('xlim_changed', lambda ax: self.refresh())
+
+    @staticmethod
+    def suits(axes, x, f):
+        """Return True if decimating f(x) would reduce the number of samples
+        plotted in 'axes'.
+        """
+        x = asarray(x)
+        f = asarray(f)
+        return (x.ndim == 1 and f.shape == x.shape and
+                x.size > 4 * _axes_pixels(axes)[1] and
+                bool((x[1:] >= x[:-1]).all()))
+
+    def _samples(self, full=False):
+        """Return the (x, f) values to plot for the visible part of the
+        signal (or all of it).
+        """
+        x, f = self.x, self.f
+        start, stop = 0, x.size
+        log_x = self.axes.get_xscale() == 'log'
+        if log_x:
+            # Samples at x <= 0 are not shown on a logarithmic axis
+            start = searchsorted(x, 0, side='right')
+        if not full:
+            # The visible samples and one more on each side
+            x0, x1 = sorted(self.axes.get_xlim())
+            start = max(searchsorted(x, x0) - 1, start)
+            stop = min(searchsorted(x, x1, side='right') + 1, stop)
+        columns = int(ceil(_axes_pixels(self.axes)[1]))
+        if stop - start <= 4 * columns:
+            return x[start:stop], f[start:stop]
+        # The first sample in each column, from the x of its left edge
+        if log_x:
+            edges = logspace(log10(x[start]), log10(x[stop - 1]),
+                             columns + 1)
         else:
-            # Make the appropriate figure active, if specified. Note, the user
-            # will have implicitly set newsubplotfig=False.
-            # The user will have to be careful here, because the module-level
-            # variables controlling the subplot matrix shape, and the next
-            # subplot index, are re-used for each plot.
-            _set_figure(figure_handle, newfig=False)
-            # The subplot layout may have changed in the middle of adding
-            # subplots to a figure. Check if layout requires smaller subplots
-            # than before, and if so, leave some space (by incrementing the
-            # subplot index counter) so that previous subplots are not
-            # overwritten.
-            if subplot_rows < subplot[0]:
-                # Skip the next subplot row
-                subplot_next_index += subplot[1]
-            elif subplot_cols < subplot[1]:
-                # Skip the next subplot column
-                subplot_next_index += 1
-        # Store these values in global variables so they are persistent
-        # between function calls.
-        subplot_rows, subplot_cols = subplot
-        subplot_mode = True
-    elif not subplot_mode:
-        # User is not in subplot mode, so create a new figure for each new
-        # plot.
-        _set_figure(figure_handle)
-    elif subplot is False:
-        # User was in subplot mode but now wants to change. Note, this False
-        # value is intentionally distinct from None.
-        subplot_mode = False
-        _set_figure(figure_handle)
-    elif subplot_next_index > (subplot_rows * subplot_cols):
-        # The user was previously in subplot mode, but the subplot matrix is
-        # already filled. The user has not specified a new subplot shape so
-        # just end subplot mode.
-        subplot = False
-        subplot_mode = False
-        _set_figure(figure_handle)
+            edges = linspace(x[start], x[stop - 1], columns + 1)
+        firsts = unique(concatenate([[start],
+                                     searchsorted(x[start:stop],
+                                                  edges[1:-1]) + start]))
+        lasts = concatenate([firsts[1:], [stop]]) - 1
+        # Minima and maxima ignore NaN, unless a column is all NaN
+        lows = fmin.reduceat(f[start:stop], firsts - start)
+        highs = fmax.reduceat(f[start:stop], firsts - start)
+        return (column_stack([x[firsts], x[firsts], x[lasts],
+                              x[lasts]]).reshape(-1),
+                column_stack([f[firsts], lows, highs, f[lasts]]).reshape(-1))
+
+    def set_data(self, x, f):
+        """Plot (samples of) another signal, ready for the axes to be scaled
+        to all of it.
+        """
+        self.x = asarray(x)
+        self.f = asarray(f)
+        self.line.set_data(*self._samples(full=True))
+
+    def refresh(self):
+        """Plot the samples for the current limits of the axes."""
+        self.line.set_data(*self._samples())
+
+
+"""
+
+Functions
+
+"""
+
+# The session used by the module-level functions. A subplot figure whose grid
+# never fills is still shown and saved when the interpreter exits.
+_default_session = FigureSession()
+atexit.register(_default_session.flush, wait=True)
+
+
+def quick_close():
+    """A wrapper for modules to close all figures without needing PyPlot as an
+    explicit dependency.
+
+    Any pending subplot figure is shown and saved first.
+    """
+    _default_session.close()
+    plt.close('all')
+
+
+def quick_flush(wait=False):
+    """Show and save the pending subplot figure (if any) now, rather than
+    when its subplot grid fills. See FigureSession.flush().
+    """
+    _default_session.flush(wait)
+
+
+# quick_plot() and quick_show() are the plot() and show() methods of the
+# default session, so that help() and tab completion show their arguments
+# and documentation.
+quick_plot = _default_session.plot
+quick_show = _default_session.show
+
+# The subplot state that was held in module-level variables before
+# FigureSession was introduced. Reading quickfunctions.subplot_mode (say)
+# gives the state of the default session; it cannot be changed this way.
+_SESSION_VARIABLES = ('subplot_mode', 'subplot_rows', 'subplot_cols',
+                      'subplot_next_index')
+
+
+def __getattr__(name):
+    if name in _SESSION_VARIABLES:
+        return getattr(_default_session, name)
+    raise AttributeError("module '" + __name__ + "' has no attribute '" +
+                         name + "'")
+
+
+def quick_render(im,
+                 fname=None,
+                 cmap=None,
+                 normalise=True,
+                 absolute=False,
+                 clip=None,
+                 log=False,
+                 vmin=None,
+                 vmax=None,
+                 out=None,
+                 compress_level=1,
+                 chunk_size=2 ** 16):
+    """Return the RGBA (uint8) pixels that quick_show(im, cmap=cmap) displays
+    for a 2-D image, computed without a figure, and save them to file 'fname'
+    if it is given.
+
+    The display transform is fused with the colour map: each chunk of
+    'chunk_size' values is converted to floating point, made absolute (if
+    'absolute' is True, or the image is complex), clipped to 'clip', replaced
+    by log(1 + value) if 'log' is True, and scaled to the N colours of the
+    colour map, while it is in the CPU cache, and then looked up in a cached
+    table of those colours. There is no title, colorbar, or resampling to the
+    size of a figure, so this is much faster than quick_show() for the frames
+    of an animation or for batch outputs. (Unlike quick_show(), integer
+    images are not rescaled to the integers 0 and 1 when normalising.)
+
+    Arguments
+    ---------
+    cmap : colour map or string
+        As for quick_show(); None for matplotlib's default colour map.
+    normalise : bool
+        As for quick_show(): if True, 'vmin' and 'vmax' are proportions of
+        the range of the (transformed) image rather than values.
+    clip : range_values
+        None, or any range accepted by intensity_range(), for example
+        (0, 100) or ('pct', 0, 99), to clip the (absolute) values to.
+    vmin, vmax : float
+        The values mapped to the first and last colours (as for imshow()), or
+        None for the minimum and maximum of the transformed image.
+    out : ndarray
+        A C-contiguous uint8 array of shape im.shape + (4,) to write the
+        pixels to, for example to reuse one array for every frame.
+    compress_level : int
+        The zlib compression level used if 'fname' is a PNG file. Writing a
+        large image at level 1 takes about half the time of PIL's default
+        level (6), for a larger file.
+    """
+    im = asarray(im)
+    if im.ndim != 2:
+        raise ValueError('quick_render() needs a 2-D image, not an image of '
+                         'shape {}'.format(im.shape))
+    if absolute or iscomplexobj(im):
+        im = abs(im)
+    colormap = plt.get_cmap(_resolve_cmap(cmap))
+    if cmap is None or isinstance(cmap, str):
+        table = _named_colormap_table(colormap.name)
     else:
-        # The user is in normal subplot mode, and has not specified a subplot
-        # matrix shape, so re-use the shape from the global variables.
-        if newsubplotfig:
-            # Create a new figure
-            _set_figure(figure_handle)
-            # Reset the subplot index counter
-            subplot_next_index = 1
+        table = _colormap_table(colormap)
+    n = colormap.N
+
+    # The range of the transformed image (each step is monotonic)
+    imin, imax = intensity_range(im)
+    if clip is not None:
+        clip = intensity_range(im, clip)
+        imin = min(max(imin, clip[0]), clip[1])
+        imax = min(max(imax, clip[0]), clip[1])
+    if log:
+        imin, imax = log1p(imin), log1p(imax)
+    # As quick_show() does, rescale to [0, 1] with the float32 arithmetic of
+    # rescale_intensity() if normalising, then apply 'vmin' and 'vmax'
+    rescale = normalise and imin != imax
+    if rescale:
+        offset, span = float32(imin), float32(imax) - float32(imin)
+        imin, imax = 0, 1
+    vmin = imin if vmin is None else vmin
+    vmax = imax if vmax is None else vmax
+
+    if out is None:
+        out = empty(im.shape + (4,), dtype=uint8)
+    elif (out.shape != im.shape + (4,) or out.dtype != uint8 or
+            not out.flags.c_contiguous):
+        raise ValueError('quick_render() needs a C-contiguous uint8 array of '
+                         'shape {} for out'.format(im.shape + (4,)))
+    # One uint32 per RGBA pixel, so each pixel is looked up as one value
+    pixels = out.view(uint32).reshape(-1)
+    flat = ascontiguousarray(im).reshape(-1)
+    work = empty(min(chunk_size, flat.size), dtype=float64)
+    work32 = empty(work.size, dtype=float32) if rescale else work
+    index = empty(work.size, dtype=intp)
+    for start in range(0, flat.size, chunk_size):
+        chunk = flat[start:start + chunk_size]
+        w = work[:chunk.size]
+        v = work32[:chunk.size]
+        v[...] = chunk
+        if clip is not None:
+            v.clip(clip[0], clip[1], out=v)
+        if log:
+            log1p(v, out=v)
+        if rescale:
+            v -= offset
+            v /= span
+            w[...] = v
+        # As Normalize and Colormap do: vmax is the last colour, and values
+        # outside [vmin, vmax] are the under and over colours
+        w -= vmin
+        if vmax != vmin:
+            w /= vmax - vmin
+            w *= n
+            w[w == n] = n - 1
+        else:
+            w *= 0
+        # Offset by one for the under colour at the start of the table
+        w += 1
+        w.clip(0, n + 1, out=w)
+        w[isnan(w)] = n + 2
+        chunk_index = index[:chunk.size]
+        chunk_index[...] = w
+        table.take(chunk_index, out=pixels[start:start + chunk_size],
+                   mode='clip')
+    if fname:
+        Image.fromarray(out, 'RGBA').save(fname,
+                                          compress_level=compress_level)
+    return out
+
+
+def quick_montage(ims,
+                  titles=None,
+                  grid=None,
+                  fname=None,
+                  cmap=None,
+                  normalise=True,
+                  shape=None,
+                  spacing=2,
+                  background=1.,
+                  label_value=0.,
+                  out=None):
+    """Lay out 2-D images in one canvas, as quick_show() does in a figure of
+    subplots, and return its RGBA (uint8) pixels from quick_render(), saving
+    them to file 'fname' if it is given.
+
+    Each image is rescaled to [0, 1] (if 'normalise' is True, as quick_show()
+    does) while it is padded or cropped (as window_2d() does) into its cell
+    of a preallocated canvas, so that the whole canvas is mapped through the
+    colour map and written once. Titles are drawn above the images from a
+    cached atlas of the glyphs of PIL's default font. Grids of hundreds of
+    images take milliseconds rather than the seconds of a subplot figure.
+
+    Arguments
+    ---------
+    ims : sequence of 2D ndarrays
+        The images, in row-major order of the grid. A None leaves its cell
+        empty, as quick_show(None) does.
+    titles : sequence of strings
+        A title for each image, or None for no titles.
+    grid : integer pair
+        The (height, width) of the grid of cells, or None for a grid that is
+        about as wide as it is high.
+    shape : integer pair
+        The (height, width) of the cell of each image, or None for the
+        largest height and width of the images.
+    spacing : int
+        The number of pixels between cells and around the canvas.
+    background, label_value : float
+        The values in [0, 1] of the background and of the titles, mapped
+        through the colour map as the rescaled images are.
+    out : ndarray
+        As for quick_render().
+    """
+    ims = [None if im is None else asarray(im) for im in ims]
+    if any(im is not None and im.ndim != 2 for im in ims):
+        raise ValueError('quick_montage() needs 2-D images')
+    if grid is None:
+        width = int(ceil(sqrt(len(ims))))
+        grid = (-(-len(ims) // width), width)
+    if shape is None:
+        shape = tuple(max([im.shape[i] for im in ims if im is not None] +
+                          [1]) for i in range(2))
+    label_height = 0
+    if titles is not None:
+        label_height = _glyph_atlas()[0].shape[0] + 2
+    cell_rows = label_height + shape[0] + spacing
+    cell_cols = shape[1] + spacing
+
+    canvas = empty((grid[0] * cell_rows + spacing,
+                    grid[1] * cell_cols + spacing), dtype=float32)
+    canvas.fill(background)
+    for n, im in enumerate(ims[:grid[0] * grid[1]]):
+        top = spacing + (n // grid[1]) * cell_rows
+        left = spacing + (n % grid[1]) * cell_cols
+        if titles is not None and n < len(titles) and titles[n]:
+            _draw_label(canvas[top:top + label_height,
+                               left:left + shape[1]],
+                        titles[n], label_value)
+        if im is None:
+            continue
+        if iscomplexobj(im):
+            im = abs(im)
+        cell = canvas[top + label_height:top + label_height + shape[0],
+                      left:left + shape[1]]
+        if normalise:
+            # Pad with the value that rescales to 'background', then rescale
+            # the cell in place
+            # (with the float32 arithmetic of rescale_intensity())
+            imin, imax = (float32(value) for value in intensity_range(im))
+            span = imax - imin if imax != imin else float32(1)
+            _fill_cell(cell, im, imin + background * span)
+            cell -= imin
+            cell /= span
         else:
-            # Make the appropriate figure active, if specified. Note, the user
-            # will have implicitly set newsubplotfig=False.
-            # The user will have to be careful here, because the module-level
-            # variables controlling the subplot matrix shape, and the next
-            # subplot index, are re-used for each plot.
-            _set_figure(figure_handle, newfig=False)
+            _fill_cell(cell, im, background)
+    return quick_render(canvas, fname, cmap=cmap, normalise=False, vmin=0,
+                        vmax=1, out=out)
+
+
+def _fill_cell(cell, im, new_val):
+    """Copy 'im' into 'cell', padded with new_val or cropped as window_2d()
+    does.
+    """
+    if im.shape == cell.shape:
+        # The usual case in a montage, without window_2d()'s overheads
+        cell[...] = im
+    else:
+        window_2d(im, cell.shape, new_val=new_val, validate='off', out=cell)
+
+
+@lru_cache(maxsize=1)
+def _glyph_atlas():
+    """Return the printable ASCII characters of PIL's default font drawn side
+    by side in one (read-only) array of their coverage of each pixel (in
+    [0, 1]), and the first column of each character in it (with the first
+    column after the last character appended).
+    """
+    font = ImageFont.load_default()
+    chars = [chr(code) for code in range(32, 127)]
+    widths = [int(ceil(font.getlength(char))) for char in chars]
+    starts = concatenate([[0], array(widths).cumsum()])
+    height = max(font.getbbox(char)[3] for char in chars)
+    atlas = Image.new('L', (int(starts[-1]), height))
+    draw = ImageDraw.Draw(atlas)
+    for char, start in zip(chars, starts):
+        draw.text((int(start), 0), char, fill=255, font=font)
+    atlas = asarray(atlas, dtype=float32) / 255
+    atlas.setflags(write=False)
+    starts.setflags(write=False)
+    return atlas, starts
+
+
+def _draw_label(strip, text, value):
+    """Blend 'text' (centred, and cropped to fit) into 'strip' with the given
+    value, using the glyphs of _glyph_atlas().
+    """
+    atlas, starts = _glyph_atlas()
+    # Characters that are not printable ASCII are drawn as '?'
+    codes = [ord(char) - 32 if 32 <= ord(char) < 127 else ord('?') - 32
+             for char in text]
+    columns = concatenate([arange(starts[code], starts[code + 1])
+                           for code in codes])
+    coverage = atlas[:, columns]
+    if coverage.shape[1] > strip.shape[1]:
+        coverage = window_2d(coverage, (coverage.shape[0], strip.shape[1]),
+                             validate='off')
+    top = (strip.shape[0] - coverage.shape[0]) // 2
+    left = (strip.shape[1] - coverage.shape[1]) // 2
+    region = strip[top:top + coverage.shape[0],
+                   left:left + coverage.shape[1]]
+    # region = region * (1 - coverage) + value * coverage
+    region -= (region - value) * coverage
+
 
+def _colormap_table(colormap):
+    """Return the colours of 'colormap' in the order that quick_render()
+    indexes them (the under colour, the N colours, the over colour, and the
+    bad colour), with each RGBA colour as one uint32 value.
+    """
+    table = concatenate([colormap(arange(-1, colormap.N + 1), bytes=True),
+                         colormap([nan], bytes=True)])
+    return ascontiguousarray(table).view(uint32).reshape(-1)
+
+
+@lru_cache(maxsize=32)
+def _named_colormap_table(name):
+    """Return the (read-only) _colormap_table() of a named colour map."""
+    table = _colormap_table(plt.get_cmap(name))
+    table.setflags(write=False)
+    return table
+
+
+def _axes_pixels(axes):
+    """Return the (height, width) of 'axes' in pixels, in the saved figure if
+    that has a higher dpi than the figure on screen.
+    """
+    figure = axes.figure
+    bbox = axes.get_window_extent()
+    savefig_dpi = matplotlib.rcParams['savefig.dpi']
+    scale = 1.
+    if isinstance(savefig_dpi, (int, float)) and savefig_dpi > figure.dpi:
+        scale = savefig_dpi / figure.dpi
+    return bbox.height * scale, bbox.width * scale
+
+
+def _apply_ylims(axes, ylims):
+    """Set the vertical limits of 'axes' as described for quick_plot()."""
+    # If ylims is a scalar/tuple/list then use its values appropriately.
+    # Otherwise, ensure that the vertical axis has some decent range so that a
+    # signal composed of purely rounding errors is not plotted in 'tight' mode.
+    if isscalar(ylims):
+        # Apply as lower limit only
+        axes.set_ylim(ylims, axes.get_ylim()[1])
+    elif isinstance(ylims, (list, tuple)) and (len(ylims) == 2):
+        # Apply as both lower and upper limits
+        axes.set_ylim(ylims)
+    elif (axes.get_ylim()[1] - axes.get_ylim()[0]) < 0.5:
+        axes.set_ylim((-1, 1))
+    else:
+        # Do nothing and let 'tight' mode decide
+        pass
+
+
+def _resolve_cmap(cmap):
+    """Return the colour map for quick_show()'s cmap argument."""
     # If a string label is passed rather than a colour map, try to infer the
     # intended colour map. Allow a European spelling for the grey/gray cmap
     # value, and silently adapt to any other misspellings of cmap label.
@@ -285,82 +1389,168 @@ def quick_show(im,
             cmap = plt.cm.get_cmap(cmap)
         except ValueError:
             cmap = None
-    if subplot_mode:
-        try:
-            plt.subplot(subplot_rows, subplot_cols, subplot_next_index)
-        except ValueError as e:
-            # Print an error message but continue (potentially populating the
-            # remainder of the subplot grid).
-            print('Error specifying an index for the subplot. Message is: ' +
-                  str(e))
-        else:
-            subplot_next_index += 1
-    if im is None:
-        # Make a blank subplot location. Only intended for sub-plot mode.
-        pass
-        # Hide axis tick labels
-        plt.axis('off')
+    return cmap
+
+
+def _prepare_image(im, normalise):
+    """Return the values that quick_show() displays for image 'im'."""
+    # A lazily rolled image has to be displayed in full, so roll it now
+    # (once) rather than in each of the functions that use it.
+    if isinstance(im, RolledView):
+        im = asarray(im)
+    # Rescale image to [0, 1] in case it contains negative values
+    if normalise:
+        im = rescale_intensity(im, out_range=(0, 1))
+    return im
+
+
+def _update_image(entry, im, title, cmap, fontsize, keywords):
+    """Replace the values (and title) of the image shown by quick_show() that
+    is recorded in 'entry'. Return True if anything but the values of the
+    image has changed (so that the whole figure needs to be redrawn).
+    """
+    image = entry['artist']
+    view = entry['view']
+    axes = image.axes
+
+    def _state():
+        shape = view.pyramid.shape if view else image.get_array().shape
+        return shape, image.get_clim(), axes.get_title()
+
+    before = _state()
+    if view:
+        view.set_pyramid(DecimationPyramid(im))
     else:
-        # Rescale image to [0, 1] in case it contains negative values
-        if normalise:
-            im = rescale_intensity(im, out_range=(0, 1))
-        # Show the image, passing the cmap, and any additional keyword
-        # arguments from dict 'keywords'.
-        plt.imshow(im, cmap=cmap, **keywords)
-        # Optional titles for figure/subplot
-        if title:
-            if fontsize:
-                plt.title(title, fontsize=fontsize)
-            else:
-                plt.title(title)
-        if suptitle:
-            if supfontsize:
-                plt.suptitle(suptitle, fontsize=supfontsize)
-            elif fontsize:
-                supfontsize = rint(int(fontsize) * 1.5)
-                plt.suptitle(suptitle, fontsize=supfontsize)
-            else:
-                plt.suptitle(suptitle)
-        # Hide axis tick labels, by default
-        if axis_off:
-            plt.axis('off')
-        # Optional tight layout
-        if tight:
-            plt.tight_layout()
-        # Optional colour bar. This has to go at the bottom, because it
-        # creates a new axis object, and subsequent calls to plt.axis('off'),
-        # for example, would turn of the ticks on the colour bar rather than
-        # on the intended axis.
-        if colorbar:
-            # If colorbar is a string, then it either refers to a preset
-            # colorbar configuration, or else it refers to a string
-            # appropriate for the 'size' parameter to append_axes().
-            # If colorbar is a float, it refers to the fraction parameter to
-            # colorbar().
-            if isinstance(colorbar, float):
-                # A factor to rescale the colorbar (for example to stop the
-                # colorbar overlapping with the title text).
-                plt.colorbar(fraction=colorbar)
-            elif colorbar == 'small':
-                # A factor that stops the colorbar from overlapping with the
-                # title text on my particular screen.
-                plt.colorbar(fraction=0.04)
-            elif colorbar == 'thin':
-                # A percentage that looks good on my particular screen, so
-                # that suplots are as large as possible.
-                _colorbar_right('2%')
-            elif isinstance(colorbar, str):
-                # Some other percentage string (possibly above percentage is
-                # too thin).
-                _colorbar_right(colorbar)
-            else:
-                # If it is simply a bool, or anything else, display the
-                # standard colorbar.
-                plt.colorbar()
-        plt.show()
-        if savefig_suffix is None:
-            savefig_suffix = ''
-        plt.savefig(f'graph{savefig_suffix}.png')
+        image.set_data(im)
+        if im.shape[:2] != before[0][:2]:
+            # The extent that imshow() gives an image of this shape
+            rows, cols = im.shape[:2]
+            image.set_extent((-0.5, cols - 0.5, rows - 0.5, -0.5))
+    image.set_cmap(cmap)
+    # Scale colours to the range of the new values, as imshow() does
+    vmin = keywords.get('vmin')
+    vmax = keywords.get('vmax')
+    image.set_clim(im.min() if vmin is None else vmin,
+                   im.max() if vmax is None else vmax)
+    if title:
+        if fontsize:
+            axes.set_title(title, fontsize=fontsize)
+        else:
+            axes.set_title(title)
+    return before != _state()
+
+
+def _window_sum(a, window_shape):
+    """Return the sums of 'a' over each window of 'window_shape' in its last
+    two axes, computed from cumulative sums as match_template() does.
+    """
+    window_sum = a.cumsum(axis=-2)
+    window_sum = (window_sum[..., window_shape[0]:-1, :] -
+                  window_sum[..., :-window_shape[0] - 1, :])
+    window_sum = window_sum.cumsum(axis=-1)
+    return (window_sum[..., window_shape[1]:-1] -
+            window_sum[..., :-window_shape[1] - 1])
+
+
+def find_peaks(corr, threshold_rel=0.99, min_distance=1, num_peaks=None,
+               subpixel=False):
+    """Find the peaks of a correlation plane (or any other 2-D array).
+
+    A peak is a value greater than threshold_rel times the maximum of corr
+    that is the maximum of the (2 * min_distance + 1) square around it (so
+    peaks are more than min_distance pixels apart in each direction). At most
+    num_peaks peaks (if passed) are returned, highest first.
+
+    If subpixel is True, each peak position is refined by fitting a parabola
+    through the peak and its neighbour on each side, in each direction.
+
+    Returns an array of (row, column) positions, one per peak, and an array
+    of the heights of the peaks.
+
+    A plateau of equal values (or a chain of equal values, each within
+    min_distance of the next) gives one peak, at its first pixel, and
+    num_peaks counts such peaks:
+
+    >>> find_peaks(ones((150, 150)))[0].tolist()
+    [[0, 0]]
+    >>> plane = zeros((9, 9))
+    >>> plane[1:3, 1:4] = plane[6, 6] = 1
+    >>> plane[4, 0] = 0.995
+    >>> find_peaks(plane)[0].tolist()
+    [[1, 1], [6, 6], [4, 0]]
+    >>> find_peaks(plane, num_peaks=2)[0].tolist()
+    [[1, 1], [6, 6]]
+    """
+    corr = asarray(corr)
+    min_distance = int(min_distance)
+    # Non-maximum suppression: keep only values that are the maximum of
+    # their neighbourhood
+    size = 2 * min_distance + 1
+    local_max = maximum_filter(corr, size=size, mode='constant', cval=-inf)
+    is_peak = (corr == local_max) & (corr > threshold_rel * amax(corr))
+    candidates = flatnonzero(is_peak)
+    heights = corr.ravel()[candidates]
+    if min_distance >= 1 and len(candidates) > 1:
+        # Candidates within min_distance of each other (in each direction)
+        # are equal, e.g. on a plateau. Grow each candidate to a square of
+        # side min_distance, so that such candidates touch, label the
+        # connected groups, and keep the first (in row-major order) of each
+        # group.
+        groups, _ = label(maximum_filter(is_peak, size=min_distance),
+                          structure=ones((3, 3)))
+        _, first = unique(groups.ravel()[candidates], return_index=True)
+        candidates, heights = candidates[first], heights[first]
+    # Select the num_peaks highest, without sorting all of the candidates
+    if num_peaks is not None and len(candidates) > num_peaks:
+        top = argpartition(-heights, num_peaks - 1)[:num_peaks]
+        candidates, heights = candidates[top], heights[top]
+    order = argsort(-heights, kind='stable')
+    candidates, heights = candidates[order], heights[order]
+    rows, cols = unravel_index(candidates, corr.shape)
+    peaks = column_stack((rows, cols))
+    if subpixel:
+        peaks = peaks.astype(float)
+        for axis in (0, 1):
+            peaks[:, axis] += _parabolic_offsets(corr, rows, cols, axis)
+    return peaks, heights
+
+
+def _parabolic_offsets(corr, rows, cols, axis):
+    """Return the offsets along 'axis' of the vertices of the parabolas
+    through each peak of corr at (rows, cols) and its two neighbours. Peaks
+    at the edge of corr are not refined.
+    """
+    offsets = zeros(len(rows))
+    index = rows if axis == 0 else cols
+    inside = (index > 0) & (index < corr.shape[axis] - 1)
+    r, c = rows[inside], cols[inside]
+    dr, dc = (1, 0) if axis == 0 else (0, 1)
+    before = corr[r - dr, c - dc]
+    centre = corr[r, c]
+    after = corr[r + dr, c + dc]
+    curvature = before - 2 * centre + after
+    fitted = zeros(len(r))
+    divide(before - after, 2 * curvature, out=fitted, where=curvature != 0)
+    offsets[inside] = fitted
+    return offsets
+
+
+def _stamp(canvas, element, peaks):
+    """Set the pixels of the boolean image 'canvas' covered by 'element'
+    centred (as binary_dilation() would centre it) on each peak. Only the
+    bounding box of each stamp is visited.
+    """
+    height, width = element.shape
+    for row, col in rint(peaks).astype(int):
+        top, left = row - height // 2, col - width // 2
+        # Clip the stamp at the edges of the canvas
+        r0, c0 = max(top, 0), max(left, 0)
+        r1 = min(top + height, canvas.shape[0])
+        c1 = min(left + width, canvas.shape[1])
+        if r0 < r1 and c0 < c1:
+            canvas[r0:r1, c0:c1] |= element[r0 - top:r1 - top,
+                                             c0 - left:c1 - left]
+    return canvas
 
 
 def _highlight_correlations(corr, shape=None, im=None):
@@ -376,18 +1566,20 @@ def _highlight_correlations(corr, shape=None, im=None):
     # a reasonable visible mask. Subtract a couple of pixels to avoid also
     # highlighting closely spaced neighbouring text/objects in the input image.
     if shape:
-        mask_element = ones(array(shape) - 3)
+        mask_element = ones(array(shape) - 3, dtype=bool)
     else:
         # The default reasonably visible mask will be circular
-        mask_element = disk(max(corr.shape) * 0.02)
+        mask_element = disk(max(corr.shape) * 0.02).astype(bool)
     # Find all correlation peaks that have a height within 1% of the height
-    # of the maximum correlation peak, and binarise corr based on this
-    # threshold.
-    corr = (corr > (0.99 * amax(corr)))
+    # of the maximum correlation peak. Two matches cannot be closer than half
+    # the size of the mask element, so neighbouring pixels of one match are
+    # not counted as separate matches.
+    peaks, _ = find_peaks(corr, threshold_rel=0.99,
+                          min_distance=max(1, min(mask_element.shape) // 2))
     # Count the number of correlation peaks
-    num_matches = count_nonzero(corr)
+    num_matches = len(peaks)
     # Impose the mask element on each correlation peak
-    corr = binary_dilation(corr, mask_element)
+    corr = _stamp(zeros(corr.shape, dtype=bool), mask_element, peaks)
     # Add the image background (if passed)
     if im is not None:
         # Unhighlight the background image by a factor "unhighlight" keeping
@@ -414,8 +1606,9 @@ def quick_correlate_images(input_fname, template_fname, method=None):
         ims, titles = method(f, t)
         method_name = method.__name__
     else:
-        # By default, apply normalised cross-correlation
-        corr = match_template(f, t, pad_input=True)
+        # By default, apply normalised cross-correlation (the same as
+        # match_template(f, t, pad_input=True))
+        corr = TemplateMatcher(t).match(f)[0]
         # Populate the same variable names used in the other branch of the if
         # statement.
         ims = (corr,)
@@ -444,4 +1637,6 @@ def quick_correlate_images(input_fname, template_fname, method=None):
     corr, num_matches = _highlight_correlations(ims[-1], shape=t.shape, im=f)
     temp_str = 'Input image with ' + str(num_matches) + ' matches highlighted'
     quick_show(corr, title=temp_str, cmap='grey', axis_off=False)
+    # The subplot grid may have empty cells, so show and save the figure now
+    quick_flush()
     # axis tight?
@@ -22,22 +22,31 @@ tjn, 13 X 2015, converted from Python 2 to Python 3
 tjn, 29 X 2015, import imread_sc, imsave_sc
 tjn, 12 XI 2015, updated arguments to quick_show() after modifications to same
 tjn, 6 X 2017, Numpy `ones` will not accept rounded floats any more (only ints)
+tjn, 16 X 2026, clip displayed spectrum at a percentile rather than 0.1% of max
+tjn, 16 X 2026, orientation filters evaluated directly with band(), and cached
 
 Tested with Anaconda using Python 3.6.
 """
 
 import os
 
-from numpy import (array, amax, ones, zeros, ceil, dstack,
-                   logical_and, logical_or, isscalar)
+from numpy import (ones, zeros, dstack, logical_and, logical_or,
+                   isscalar)
 from scipy.fftpack import fft2, ifft2, fftshift, ifftshift
 from scipy import absolute as abs
 from skimage.color import rgb2gray
 from skimage.exposure import rescale_intensity
-from skimage.transform import rotate
 
-from imageutilssubset import window_2d, disc, imread_sc, imsave_sc
-from quickfunctions import quick_show
+from imageutilssubset import disc, band, imread_sc, imsave_sc, ArrayCache
+from skimage_exposure import intensity_range
+from quickfunctions import quick_show, quick_flush
+
+# The maximum total size (in bytes) of the orientation filters cached by
+# spatial_filtering_demo(), keyed by (shape, angle, thickness, filval), so
+# that a sweep over angles (or over images of the same shape) only makes
+# each filter once
+LINE_FILTER_CACHE_BYTES = 256 * 2 ** 20
+_line_filters = ArrayCache(LINE_FILTER_CACHE_BYTES)
 
 
 def spatial_filtering_demo(a,
@@ -124,46 +133,33 @@ def spatial_filtering_demo(a,
         filter.
 
         Also, complement the filter at its lowest spatial frequencies.
+        Filters are cached (see _line_filters), so the returned array is
+        read-only.
 
         Arguments:
         imshape   : a pair denoting the shape of the image to be multiplied by
                   the filter.
         d         : is the angle of the orientation filter in degrees.
         filval    : is the value inside the filter aperture, either 1 or 0.
-        thickness : is the height of the aperture before rotation (the width of
-                  the aperture is dependent on its orientation).
+        thickness : is the thickness of the aperture (perpendicular to its
+                  orientation).
         """
-
-        # Set up the values for everywhere OUTSIDE the filter.
-        # Make it as long as the diagonal of the required imshape, using
-        # Pythagoras and sqrt(2) = 1.414 .
-        f = ones(ceil(array(imshape) * 1.414).astype(int)) - filval
-
-        # Set the values inside the filter (assume a horizontal orientation
-        # before rotation).
-        # Octave: f[floor(size(f, 1)/2)-8:floor(size(f, 1)/2)+7, :] = filval;
-        half_height = f.shape[0] // 2
-        # thickness of line to left and right (respectively) of centre
-        l_thick = thickness // 2
-        r_thick = thickness - l_thick
-        f[half_height - l_thick:half_height + r_thick, :] = filval
-        # Do it this way in future:
-        # aperture = ones((thickness, f.shape[1]))
-        # f = window_2d(f, superpose=aperture)
-
-        # Rotate anticlockwise by d degrees
-        f = rotate(f, d)
-
-        # Crop filter to required dimensions
-        f = window_2d(f, imshape)
-
-        # Remove the lowest spatial frequencies from the filter
-        if filval:
-            f = logical_and(f, construct_disc(imshape, 0.05, 0))
-        else:
-            f = logical_or(f, construct_disc(imshape, 0.2, 1))
-
-        return f
+        def _make_line():
+            # The aperture is a band through the centre of the spectrum,
+            # oriented anticlockwise by d degrees from the horizontal. Each
+            # pixel is tested against its distance from the band's centre
+            # line, rather than rotating (and cropping) an image of a
+            # horizontal band.
+            aperture = band(thickness, d, imshape)
+
+            # Remove the lowest spatial frequencies from the filter
+            if filval:
+                return logical_and(aperture, construct_disc(imshape, 0.05, 0))
+            else:
+                return logical_or(~aperture, construct_disc(imshape, 0.2, 1))
+
+        key = (tuple(imshape), d, thickness, filval)
+        return _line_filters.get(key, _make_line)
 
     """
     Main body of function starts here
@@ -213,10 +209,10 @@ def spatial_filtering_demo(a,
     # Fourier transform image
     A = fftshift(fft2(a))
     # Allow full detail of spectrum to be easily appreciated on low dynamic
-    # range displays by clipping its values.
+    # range displays by clipping its brightest 1% of values.
     if show == 'a':
         Atemp = abs(A)
-        clip_val = amax(Atemp) * 0.001
+        clip_val = intensity_range(Atemp, ('pct', 0, 99))[1]
         quick_show(Atemp.clip(0, clip_val),
                    'Amplitude of Fourier spectrum',
                    cmap='grey')
@@ -251,6 +247,9 @@ def spatial_filtering_demo(a,
         tempstr = ('Image amplitude, (p=' + str(param1) +
                    ', f=' + str(filval) + ')')
         quick_show(a, tempstr, cmap='grey')
+        # Show and save the figure now, even if its subplot grid has empty
+        # cells (e.g. when show is 'f', or for a larger subplot grid)
+        quick_flush()
 
     # print('This ' + str(a.shape) + ' pixel image now contains ' +
     #      str(a.dtype) + ' values in the range [' + str(amin(a)) + ', ' +